@@ -0,0 +1,179 @@
+"""
+Endpoint de agenda semanal pre-renderizada para la tablet
+Devuelve las citas confirmadas ya normalizadas y agrupadas por día y slot
+de la rejilla HORARIOS, con un hash de versión para revalidar con ETag
+"""
+import os
+import json
+import hashlib
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+
+def generar_horarios(horarios_str, duracion):
+    """Rejilla de horas del día, igual que HorarioService.generar() en app.js"""
+    horas = []
+    for rango in horarios_str.split(','):
+        inicio, fin = rango.split('-')
+        t = datetime.strptime(inicio, '%H:%M')
+        limite = datetime.strptime(fin, '%H:%M')
+        while t <= limite:
+            horas.append(t.strftime('%H:%M'))
+            t += timedelta(minutes=duracion)
+    return horas
+
+
+def generar_dias(desde, cantidad, dias_laborables):
+    """`cantidad` días laborables a partir de `desde` (1=lunes ... 7=domingo)"""
+    dias = []
+    dia = desde
+    while len(dias) < cantidad:
+        if dia.isoweekday() in dias_laborables:
+            dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
+
+def normalizar_cita(cita):
+    """Mismo formato que ApiService.getCitas() en app.js"""
+    return {
+        'id': cita.get('Id'),
+        'start': cita.get('startTime'),
+        'end': cita.get('endTime'),
+        'name': cita.get('Nombre'),
+        'phone': str(cita.get('Telefono') or ''),
+        'email': cita.get('Email') or '',
+        'service': cita.get('Servicio'),
+        'matricula': cita.get('Matricula') or '',
+        'modelo': cita.get('Modelo') or '',
+        'notes': cita.get('Notas') or '',
+        'estado': cita.get('Estado'),
+        'cancelToken': cita.get('CancelToken')
+    }
+
+
+def construir_agenda(citas, dias, horarios, duracion, tz):
+    """
+    Agrupa las citas por día y slot. Una cita ocupa el slot cuyo intervalo
+    [hora, hora + duración) contiene su inicio en hora local (como buscarCitaEnSlot).
+    `citas` incluye todas las recibidas (las estadísticas las cuentan todas), también
+    las que caen fuera de la rejilla o en un slot ya ocupado; solo esas no se agrupan.
+    """
+    inicios = [int(h[:2]) * 60 + int(h[3:]) for h in horarios]
+    fechas = {d.isoformat(): {} for d in dias}
+    normalizadas = []
+
+    for cita in sorted(citas, key=lambda c: c.get('startTime') or ''):
+        normalizadas.append(normalizar_cita(cita))
+        try:
+            inicio = datetime.fromisoformat(cita['startTime'].replace('Z', '+00:00')).astimezone(tz)
+        except (KeyError, AttributeError, ValueError):
+            continue
+        slots = fechas.get(inicio.date().isoformat())
+        if slots is None:
+            continue
+        minuto = inicio.hour * 60 + inicio.minute
+        indice = next((i for i, s in enumerate(inicios) if s <= minuto < s + duracion), None)
+        if indice is None or str(indice) in slots:
+            continue
+        slots[str(indice)] = len(normalizadas) - 1
+
+    agenda = {
+        'desde': dias[0].isoformat(),
+        'hasta': dias[-1].isoformat(),
+        'timezone': str(tz),
+        'duracion': duracion,
+        'horarios': horarios,
+        'dias': [{'fecha': fecha, 'slots': slots} for fecha, slots in fechas.items()],
+        'citas': normalizadas
+    }
+    canonico = json.dumps(agenda, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    agenda['version'] = hashlib.sha256(canonico.encode()).hexdigest()[:16]
+    return agenda
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Agenda de `dias` días laborables desde `desde` (YYYY-MM-DD)"""
+        origin = self.headers.get('Origin', '')
+        allowed_origins = ['https://tablet.arvera.es', 'https://citas.arvera.es', 'http://localhost:3000', 'http://localhost:5173']
+
+        try:
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            desde = date.fromisoformat(params.get('desde', date.today().isoformat()))
+            cantidad = max(1, min(int(params.get('dias', '7')), 31))
+        except ValueError:
+            self._error(400, 'Parámetros no válidos: desde=YYYY-MM-DD, dias=1..31')
+            return
+
+        try:
+            # Configuración de la rejilla (mismas variables que /api/env)
+            tz = ZoneInfo(os.getenv('TIMEZONE', 'Europe/Madrid'))
+            duracion = int(os.getenv('DURACION_CITA', '45'))
+            horarios = generar_horarios(os.getenv('HORARIOS', '08:30-12:15,15:45-18:00'), duracion)
+            dias_laborables = {int(d) for d in os.getenv('DIAS_LABORABLES', '1,2,3,4,5').split(',')}
+            dias = generar_dias(desde, cantidad, dias_laborables)
+
+            # Citas confirmadas del rango (un día extra al final, como cargarCitas)
+            api_base_url = os.getenv('API_BASE_URL', 'https://api-citas-seven.vercel.app/api')
+            fin = dias[-1] + timedelta(days=1)
+            target_url = f"{api_base_url}/citas?startDate={dias[0].isoformat()}&endDate={fin.isoformat()}&estado=Confirmada"
+            req = Request(target_url, headers={
+                'Content-Type': 'application/json',
+                'X-API-Key': os.getenv('API_KEY', '')
+            })
+            with urlopen(req) as response:
+                citas = json.loads(response.read())
+
+            agenda = construir_agenda(citas if isinstance(citas, list) else [], dias, horarios, duracion, tz)
+            etag = f'"{agenda["version"]}"'
+
+            # Semana sin cambios: la tablet reutiliza lo que ya tiene pintado
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Access-Control-Allow-Origin', origin if origin in allowed_origins else 'https://tablet.arvera.es')
+                self.end_headers()
+                return
+
+            data = json.dumps(agenda, separators=(',', ':'), ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'private, no-cache')
+            self.send_header('Access-Control-Allow-Origin', origin if origin in allowed_origins else 'https://tablet.arvera.es')
+            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+            self.send_header('Access-Control-Expose-Headers', 'ETag')
+            self.end_headers()
+            self.wfile.write(data)
+
+        except HTTPError as e:
+            # Propagar errores HTTP del upstream
+            self.send_response(e.code)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(e.read())
+
+        except Exception as e:
+            self._error(500, str(e))
+
+    def _error(self, status, mensaje):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': mensaje}).encode())
+
+    def do_OPTIONS(self):
+        """Manejar preflight CORS"""
+        origin = self.headers.get('Origin', '')
+        allowed_origins = ['https://tablet.arvera.es', 'https://citas.arvera.es', 'http://localhost:3000', 'http://localhost:5173']
+
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', origin if origin in allowed_origins else 'https://tablet.arvera.es')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.end_headers()
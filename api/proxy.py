@@ -3,11 +3,590 @@ Proxy serverless para llamadas API
 Maneja API_KEY de forma segura en el servidor
 """
 import os
+import re
 import json
+import time
+import queue
+import base64
+import bisect
+import hashlib
+import secrets
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError
 
+# ============================================================
+# Captura de tráfico (opt-in con PROXY_CAPTURA)
+# ============================================================
+
+# Parámetros que nunca se guardan en la captura (datos personales)
+PARAMS_SENSIBLES = {'nombre', 'name', 'telefono', 'phone', 'email', 'token', 'canceltoken'}
+PATRON_TELEFONO = re.compile(r'^\+?\d[\d\s]{7,}$')
+
+_captura_logger = None
+_captura_lock = threading.Lock()
+
+
+def _obtener_captura():
+    """
+    Devuelve el logger de captura, o None si PROXY_CAPTURA no está configurada.
+    PROXY_CAPTURA=stdout escribe en la salida estándar (logs de la función en Vercel,
+    donde /tmp es temporal y propio de cada instancia); cualquier otro valor es la
+    ruta de un log rotado.
+    """
+    global _captura_logger
+    ruta = os.getenv('PROXY_CAPTURA', '')
+    if not ruta:
+        return None
+    with _captura_lock:
+        if _captura_logger is None:
+            logger = logging.getLogger('proxy.captura')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            if ruta == 'stdout':
+                salida = logging.StreamHandler(sys.stdout)
+            else:
+                salida = RotatingFileHandler(
+                    ruta,
+                    maxBytes=int(os.getenv('PROXY_CAPTURA_MAX_BYTES', str(5 * 1024 * 1024))),
+                    backupCount=int(os.getenv('PROXY_CAPTURA_BACKUPS', '3')),
+                    encoding='utf-8'
+                )
+            salida.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(salida)
+            _captura_logger = logger
+    return _captura_logger
+
+
+def plantilla_ruta(path):
+    """Convierte /citas/20260108173953-2683cfa7 en /citas/{id}"""
+    segmentos = path.split('/')
+    for i in range(1, len(segmentos)):
+        if segmentos[i - 1] == 'citas' and segmentos[i]:
+            segmentos[i] = '{id}'
+    return '/'.join(segmentos)
+
+
+def anonimizar_query(query):
+    """Elimina nombre/teléfono/email y cualquier valor con forma de teléfono"""
+    params = {}
+    for clave, valor in parse_qsl(query, keep_blank_values=True):
+        if clave.lower() in PARAMS_SENSIBLES or PATRON_TELEFONO.match(valor):
+            continue
+        params[clave] = valor
+    return params
+
+
+def registrar_captura(method, path, body_size, status, upstream_ms, response_size):
+    """Añade una línea JSON compacta al log de captura (si está activo)"""
+    logger = _obtener_captura()
+    if logger is None:
+        return
+    partes = urlsplit(path)
+    registro = {
+        't': round(time.time() * 1000),
+        'm': method,
+        'p': plantilla_ruta(partes.path),
+        'q': anonimizar_query(partes.query),
+        'b': body_size,
+        's': status,
+        'u': round(upstream_ms, 1) if upstream_ms is not None else None,
+        'r': response_size
+    }
+    try:
+        logger.info(json.dumps(registro, separators=(',', ':'), ensure_ascii=False))
+    except Exception:
+        # La captura nunca debe romper el proxy
+        pass
+
+
+# ============================================================
+# Notificaciones write-behind (webhook de cambios)
+# ============================================================
+
+class ColaNotificaciones:
+    """
+    Cola acotada en memoria que envía al webhook los cambios confirmados por el upstream.
+    Un hilo de fondo agrupa los cambios que llegan en ráfaga en una sola notificación
+    y reintenta con backoff exponencial si el webhook falla.
+
+    En serverless (Vercel) la instancia se congela en cuanto el handler vuelve, así que
+    el hilo no llegaría a enviar: allí no se usa la cola (ver notificacion_en_cliente).
+    """
+
+    def __init__(self, capacidad=200, lote=50, ventana=0.25, reintentos=3):
+        self.cola = queue.Queue(maxsize=capacidad)
+        self.lote = lote
+        self.ventana = ventana
+        self.reintentos = reintentos
+        self.enviadas = 0
+        self.descartadas = 0
+        self.fallidas = 0
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def encolar(self, cambio):
+        """Añade un cambio sin bloquear; devuelve False si la cola está llena"""
+        self._arrancar()
+        try:
+            self.cola.put_nowait(cambio)
+            return True
+        except queue.Full:
+            # Los cambios pendientes ya provocarán una notificación: basta con contarlo
+            with self._lock:
+                self.descartadas += 1
+            return False
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._trabajar, name='notificaciones', daemon=True)
+                self._hilo.start()
+
+    def _trabajar(self):
+        while True:
+            cambios = [self.cola.get()]
+            # Esperar un poco para agrupar la ráfaga en una sola notificación
+            time.sleep(self.ventana)
+            while len(cambios) < self.lote:
+                try:
+                    cambios.append(self.cola.get_nowait())
+                except queue.Empty:
+                    break
+            self._enviar(cambios)
+
+    def _enviar(self, cambios):
+        webhook_url = os.getenv('WEBHOOK_URL', 'https://webhook.arvera.es/webhook/cal-event')
+        payload = json.dumps({
+            'triggerEvent': 'CITA_CHANGED',
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'cambios': cambios
+        }).encode()
+        for intento in range(self.reintentos + 1):
+            try:
+                req = Request(webhook_url, data=payload, headers={'Content-Type': 'application/json'}, method='POST')
+                with urlopen(req, timeout=5) as response:
+                    response.read()
+                self.enviadas += 1
+                return True
+            except Exception:
+                if intento < self.reintentos:
+                    time.sleep(0.5 * 2 ** intento)
+        self.fallidas += 1
+        return False
+
+
+_notificaciones = ColaNotificaciones()
+
+
+def notificaciones_activas():
+    """PROXY_NOTIFICAR=0 o un WEBHOOK_URL vacío desactivan la notificación de cambios"""
+    return os.getenv('PROXY_NOTIFICAR', '1') != '0' and bool(os.getenv('WEBHOOK_URL', 'https://webhook.arvera.es/webhook/cal-event'))
+
+
+def notificacion_en_cliente():
+    """
+    En serverless no hay segundo plano: lo que el handler haga tras escribir la respuesta
+    retrasa la entrega al cliente (Vercel la entrega al volver). Allí el proxy solo marca
+    la respuesta con X-Notificar-Cambio y el cliente llama al webhook sin esperarlo.
+    """
+    return bool(os.getenv('VERCEL')) or os.getenv('PROXY_NOTIFICAR_CLIENTE') == '1'
+
+
+def notificar_cambio(method, path):
+    """Encola la notificación de una escritura confirmada"""
+    _notificaciones.encolar({'accion': method, 'ruta': plantilla_ruta(urlsplit(path).path)})
+
+
+# ============================================================
+# Retención optimista de slots y detección de conflictos
+# ============================================================
+
+def instante(valor):
+    """ISO 8601 (con Z u offset) -> segundos epoch, o None si no es válido"""
+    if not valor or not isinstance(valor, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def extraer_cita(datos):
+    """La API puede devolver la cita tal cual o envuelta en {'cita': ...}"""
+    if isinstance(datos, dict) and isinstance(datos.get('cita'), dict):
+        return datos['cita']
+    return datos if isinstance(datos, dict) else None
+
+
+class IndiceReservas:
+    """
+    Índice de intervalos en memoria con las citas confirmadas creadas o modificadas a
+    través del proxy más las retenciones activas de altas en curso. Permite rechazar
+    con 409 un POST que solapa con otro antes de la escritura (lenta) en el upstream.
+
+    Las citas que solo se conocen por un listado no se usan para rechazar: pueden
+    haberse cancelado por otra vía (enlace /api/cancelar) y el slot estaría libre.
+    Los listados sí sirven para olvidar citas del índice que ya no están confirmadas.
+
+    Es una protección best-effort por instancia: la API sigue siendo la fuente de verdad.
+    """
+
+    def __init__(self, ttl_retencion=60, ttl_conocidas=600):
+        self.ttl_retencion = ttl_retencion
+        self.ttl_conocidas = ttl_conocidas
+        self._lock = threading.Lock()
+        self._intervalos = []  # (inicio, fin, clave) ordenado por inicio
+        self._entradas = {}    # clave -> (inicio, fin, expira)
+        self._duracion_max = 0
+
+    def _insertar(self, clave, inicio, fin, expira):
+        self._eliminar(clave)
+        bisect.insort(self._intervalos, (inicio, fin, clave))
+        self._entradas[clave] = (inicio, fin, expira)
+        self._duracion_max = max(self._duracion_max, fin - inicio)
+
+    def _eliminar(self, clave):
+        entrada = self._entradas.pop(clave, None)
+        if entrada:
+            i = bisect.bisect_left(self._intervalos, (entrada[0], entrada[1], clave))
+            if i < len(self._intervalos) and self._intervalos[i][2] == clave:
+                del self._intervalos[i]
+
+    def _conflicto(self, inicio, fin, ahora):
+        """Clave del primer intervalo vigente que solapa con [inicio, fin)"""
+        caducadas = []
+        conflicto = None
+        # Solo pueden solapar los que empiezan antes de `fin` y no antes de inicio - duración máxima
+        i = bisect.bisect_left(self._intervalos, (fin,))
+        while i > 0:
+            i -= 1
+            otro_inicio, otro_fin, clave = self._intervalos[i]
+            if otro_inicio <= inicio - self._duracion_max:
+                break
+            if self._entradas[clave][2] < ahora:
+                caducadas.append(clave)
+            elif otro_fin > inicio:
+                conflicto = clave
+                break
+        for clave in caducadas:
+            self._eliminar(clave)
+        return conflicto
+
+    def retener(self, inicio, fin):
+        """Reserva [inicio, fin) durante ttl_retencion; devuelve el token o None si hay conflicto"""
+        ahora = time.time()
+        with self._lock:
+            if self._conflicto(inicio, fin, ahora):
+                return None
+            token = f'retencion:{secrets.token_hex(8)}'
+            self._insertar(token, inicio, fin, ahora + self.ttl_retencion)
+            return token
+
+    def liberar(self, token):
+        with self._lock:
+            self._eliminar(token)
+
+    def confirmar(self, token, cita):
+        """
+        Sustituye la retención por la cita creada en el upstream. Si la respuesta no
+        trae la cita, la retención se mantiene hasta caducar: el slot ya está ocupado.
+        """
+        cita = extraer_cita(cita)
+        if not cita or not cita.get('Id'):
+            return
+        with self._lock:
+            self._eliminar(token)
+            self._registrar(cita, time.time())
+
+    def registrar(self, cita):
+        """Cita escrita a través del proxy (alta o cambio)"""
+        with self._lock:
+            self._registrar(cita, time.time())
+
+    def _registrar(self, cita, ahora):
+        if not isinstance(cita, dict) or not cita.get('Id'):
+            return
+        inicio = instante(cita.get('startTime'))
+        fin = instante(cita.get('endTime'))
+        if cita.get('Estado', 'Confirmada') != 'Confirmada' or inicio is None or fin is None or fin <= inicio:
+            self._eliminar(cita['Id'])
+        else:
+            self._insertar(cita['Id'], inicio, fin, ahora + self.ttl_conocidas)
+
+    def sincronizar(self, citas, desde=None, hasta=None):
+        """
+        Actualiza con un listado de GET /citas las citas que el índice ya conoce (no
+        añade nuevas). Si el listado cubre un rango completo de confirmadas, las citas
+        conocidas de ese rango que no aparecen se olvidan.
+        """
+        ahora = time.time()
+        with self._lock:
+            for cita in citas:
+                if isinstance(cita, dict) and cita.get('Id') in self._entradas:
+                    self._registrar(cita, ahora)
+            if desde is not None and hasta is not None:
+                presentes = {c.get('Id') for c in citas if isinstance(c, dict)}
+                for clave, (inicio, _, _) in list(self._entradas.items()):
+                    if not clave.startswith('retencion:') and desde <= inicio <= hasta and clave not in presentes:
+                        self._eliminar(clave)
+
+    def olvidar(self, cita_id):
+        with self._lock:
+            self._eliminar(cita_id)
+
+
+_reservas = IndiceReservas(
+    ttl_retencion=int(os.getenv('PROXY_RETENCION_SEGUNDOS', '60')),
+    ttl_conocidas=int(os.getenv('PROXY_RESERVAS_TTL', '600'))
+)
+
+
+def conflictos_activos():
+    return os.getenv('PROXY_CONFLICTOS', '1') != '0'
+
+
+def retener_slot(path, body):
+    """
+    Para POST /citas: devuelve (token, conflicto). token es None si no aplica
+    (cuerpo no válido o detección desactivada); conflicto indica un solape.
+    """
+    if not conflictos_activos() or urlsplit(path).path.rstrip('/') != '/citas' or not body:
+        return None, False
+    try:
+        datos = json.loads(body)
+    except ValueError:
+        return None, False
+    if not isinstance(datos, dict):
+        return None, False
+    inicio = instante(datos.get('startTime'))
+    fin = instante(datos.get('endTime'))
+    if inicio is None or fin is None or fin <= inicio:
+        return None, False
+    token = _reservas.retener(inicio, fin)
+    return token, token is None
+
+
+def actualizar_indice(method, path, body, response_data):
+    """Alimenta el índice de reservas con las respuestas correctas del upstream"""
+    if not conflictos_activos():
+        return
+    partes = urlsplit(path)
+    segmentos = [s for s in partes.path.split('/') if s]
+    if segmentos[:1] != ['citas']:
+        return
+    try:
+        datos = json.loads(response_data) if response_data else None
+    except ValueError:
+        datos = None
+
+    if method == 'GET' and len(segmentos) == 1 and isinstance(datos, list):
+        params = dict(parse_qsl(partes.query))
+        desde = hasta = None
+        if params.get('estado', 'Confirmada') == 'Confirmada' and params.get('startDate') and params.get('endDate'):
+            desde = instante(params['startDate'] if 'T' in params['startDate'] else params['startDate'] + 'T00:00:00Z')
+            hasta = instante(params['endDate'] if 'T' in params['endDate'] else params['endDate'] + 'T23:59:59Z')
+        _reservas.sincronizar(datos, desde, hasta)
+    elif method == 'DELETE' and len(segmentos) == 2:
+        _reservas.olvidar(segmentos[1])
+    elif method == 'PUT' and len(segmentos) == 2:
+        cita = extraer_cita(datos)
+        if not (cita and cita.get('startTime')):
+            try:
+                cita = {**json.loads(body), 'Id': segmentos[1]} if body else None
+            except ValueError:
+                cita = None
+        if isinstance(cita, dict) and cita.get('startTime') and cita.get('endTime'):
+            _reservas.registrar({**cita, 'Id': cita.get('Id') or segmentos[1]})
+
+
+# ============================================================
+# Idempotency-Key para escrituras (reintentos sin duplicados)
+# ============================================================
+
+class AlmacenIdempotencia:
+    """
+    Guarda la respuesta de cada escritura con cabecera Idempotency-Key durante `ttl`
+    segundos, para devolver la misma respuesta si la petición se repite (p. ej. la
+    cola offline del Service Worker reenviando tras recuperar la conexión).
+
+    Es best-effort por instancia, como IndiceReservas: un reintento que llega a otra
+    instancia de Vercel (o tras un arranque en frío) no encuentra la respuesta.
+
+    Como mucho guarda `capacidad` respuestas (se descartan las más antiguas). Un
+    duplicado que llega mientras la original sigue en curso espera hasta `espera`
+    segundos a su respuesta en vez de repetir la escritura.
+    """
+
+    def __init__(self, ttl=86400, capacidad=1000, espera=30):
+        self.ttl = ttl
+        self.capacidad = capacidad
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._respuestas = OrderedDict()  # clave -> (huella, status, data, expira), por orden de alta
+        self._en_curso = {}  # clave -> (huella, evento)
+
+    def _purgar(self, ahora):
+        while self._respuestas:
+            clave, entrada = next(iter(self._respuestas.items()))
+            if entrada[3] >= ahora and len(self._respuestas) <= self.capacidad:
+                break
+            del self._respuestas[clave]
+
+    def reservar(self, clave, huella):
+        """
+        Devuelve una tupla (estado, valor):
+        - ('respuesta', (status, data)): ya hay respuesta guardada para la clave
+        - ('distinta', None): la clave se usó con otro body
+        - ('en_curso', None): la original sigue en curso después de `espera` segundos
+          (el handler responde 503 con Retry-After)
+        - ('propia', turno): esta petición hace la escritura; después hay que llamar
+          a guardar() o soltar() con el turno
+        """
+        limite = time.monotonic() + self.espera
+        while True:
+            with self._lock:
+                self._purgar(time.time())
+                entrada = self._respuestas.get(clave)
+                if entrada:
+                    return ('respuesta', entrada[1:3]) if entrada[0] == huella else ('distinta', None)
+                en_curso = self._en_curso.get(clave)
+                if en_curso is None:
+                    turno = threading.Event()
+                    self._en_curso[clave] = (huella, turno)
+                    return 'propia', turno
+                if en_curso[0] != huella:
+                    return 'distinta', None
+            restante = limite - time.monotonic()
+            if restante <= 0 or not en_curso[1].wait(restante):
+                return 'en_curso', None
+
+    def guardar(self, clave, turno, huella, status, data):
+        """Guarda la respuesta y despierta a los duplicados en espera"""
+        ahora = time.time()
+        with self._lock:
+            self._respuestas[clave] = (huella, status, data, ahora + self.ttl)
+            self._purgar(ahora)
+            self._soltar(clave, turno)
+
+    def soltar(self, clave, turno):
+        """Termina el turno sin respuesta (5xx, error de red): un duplicado en espera lo reintenta"""
+        with self._lock:
+            self._soltar(clave, turno)
+
+    def _soltar(self, clave, turno):
+        en_curso = self._en_curso.get(clave)
+        if en_curso and en_curso[1] is turno:
+            del self._en_curso[clave]
+        turno.set()
+
+
+_idempotencia = AlmacenIdempotencia(
+    ttl=int(os.getenv('PROXY_IDEMPOTENCIA_TTL', '86400')),
+    capacidad=int(os.getenv('PROXY_IDEMPOTENCIA_MAX', '1000')),
+    espera=float(os.getenv('PROXY_IDEMPOTENCIA_ESPERA', '30'))
+)
+
+
+def clave_idempotencia(method, path, cabecera):
+    """La clave solo vale para la misma operación (método + ruta)"""
+    if not cabecera or method not in ('POST', 'PUT', 'DELETE'):
+        return None
+    return f'{method} {urlsplit(path).path} {cabecera.strip()}'
+
+
+def huella_body(body):
+    """Identifica el body de una escritura para detectar claves reutilizadas con otro contenido"""
+    return hashlib.sha256(body or b'').hexdigest()
+
+# ============================================================
+# Proyección de campos y paginación de GET /citas
+# ============================================================
+
+PARAMS_LISTADO = ('fields', 'limit', 'after')
+LIMITE_MAXIMO = 500
+
+
+def codificar_cursor(cita):
+    clave = json.dumps([cita.get('startTime') or '', cita.get('Id') or ''], separators=(',', ':'))
+    return base64.urlsafe_b64encode(clave.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    relleno = '=' * (-len(cursor) % 4)
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor no válido')
+    if not (isinstance(clave, list) and len(clave) == 2 and all(isinstance(v, str) for v in clave)):
+        raise ValueError('Cursor no válido')
+    return tuple(clave)
+
+
+def separar_opciones_listado(method, path):
+    """
+    Extrae fields/limit/after de GET /citas (el upstream no los conoce).
+    Devuelve (path_upstream, opciones) u opciones None si no aplica.
+    Lanza ValueError si los parámetros no son válidos.
+    """
+    partes = urlsplit(path)
+    if method != 'GET' or partes.path.rstrip('/') != '/citas':
+        return path, None
+    params = parse_qsl(partes.query, keep_blank_values=True)
+    propios = {k: v for k, v in params if k in PARAMS_LISTADO}
+    if not propios:
+        return path, None
+
+    opciones = {'fields': None, 'limit': None, 'after': None}
+    if propios.get('fields'):
+        opciones['fields'] = [f.strip() for f in propios['fields'].split(',') if f.strip()]
+    if propios.get('limit'):
+        try:
+            limite = int(propios['limit'])
+        except ValueError:
+            raise ValueError('limit debe ser un número entero')
+        if not 1 <= limite <= LIMITE_MAXIMO:
+            raise ValueError(f'limit debe estar entre 1 y {LIMITE_MAXIMO}')
+        opciones['limit'] = limite
+    if propios.get('after'):
+        opciones['after'] = decodificar_cursor(propios['after'])
+
+    query = urlencode([(k, v) for k, v in params if k not in PARAMS_LISTADO])
+    return partes.path + (f'?{query}' if query else ''), opciones
+
+
+def aplicar_opciones_listado(response_data, opciones):
+    """Pagina por (startTime, Id) y proyecta campos; devuelve (bytes, cursor siguiente)"""
+    citas = json.loads(response_data)
+    if not isinstance(citas, list):
+        return response_data, None
+
+    siguiente = None
+    if opciones['limit'] or opciones['after']:
+        citas = sorted(citas, key=lambda c: (c.get('startTime') or '', c.get('Id') or ''))
+        if opciones['after']:
+            citas = [c for c in citas if (c.get('startTime') or '', c.get('Id') or '') > opciones['after']]
+        if opciones['limit'] and len(citas) > opciones['limit']:
+            citas = citas[:opciones['limit']]
+            siguiente = codificar_cursor(citas[-1])
+
+    if opciones['fields']:
+        campos = opciones['fields']
+        citas = [{campo: c[campo] for campo in campos if campo in c} for c in citas]
+
+    return json.dumps(citas, separators=(',', ':'), ensure_ascii=False).encode(), siguiente
+
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Proxy GET requests"""
@@ -27,19 +606,78 @@ class handler(BaseHTTPRequestHandler):
     
     def _proxy_request(self, method):
         """Proxy la petición añadiendo API_KEY de forma segura"""
+        path = self.path.replace('/api/proxy', '')
+        body = None
+        status = 500
+        upstream_ms = None
+        response_size = 0
+        retencion = None
+        idempotencia = None
+        turno = None
         try:
             # Obtener API_KEY del servidor (nunca expuesta al cliente)
             api_key = os.getenv('API_KEY', '')
             api_base_url = os.getenv('API_BASE_URL', 'https://api-citas-seven.vercel.app/api')
             
-            # Construir URL destino
-            path = self.path.replace('/api/proxy', '')
-            target_url = f"{api_base_url}{path}"
-            
             # Leer body si existe
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length) if content_length > 0 else None
             
+            # Escritura repetida con la misma Idempotency-Key: devolver la respuesta original
+            # (si la original sigue en curso, se espera a su respuesta)
+            idempotencia = clave_idempotencia(method, path, self.headers.get('Idempotency-Key'))
+            if idempotencia:
+                huella = huella_body(body)
+                estado, valor = _idempotencia.reservar(idempotencia, huella)
+                if estado == 'respuesta':
+                    status, response_data = valor
+                    cabeceras = {'Idempotent-Replayed': 'true'}
+                    # El cliente pudo perder la respuesta original y con ella el aviso de notificar
+                    if (200 <= status < 300 and path.startswith('/citas')
+                            and notificaciones_activas() and notificacion_en_cliente()):
+                        cabeceras['X-Notificar-Cambio'] = '1'
+                    response_size = self._enviar_respuesta(status, response_data, cabeceras)
+                    return
+                if estado == 'distinta':
+                    status = 422
+                    response_size = self._enviar_respuesta(422, json.dumps({
+                        'error': 'La Idempotency-Key ya se usó con otra petición'
+                    }).encode())
+                    return
+                if estado == 'en_curso':
+                    # 503 y no 409: los clientes tratan 409 como "horario ocupado" y descartan la cita
+                    status = 503
+                    response_size = self._enviar_respuesta(503, json.dumps({
+                        'error': 'Hay una petición con la misma Idempotency-Key en curso'
+                    }).encode(), {'Retry-After': '1'})
+                    return
+                turno = valor
+            
+            # Proyección y paginación de GET /citas (se aplican en el proxy)
+            try:
+                upstream_path, opciones_listado = separar_opciones_listado(method, path)
+            except ValueError as e:
+                status = 400
+                response_size = self._enviar_respuesta(400, json.dumps({'error': str(e)}).encode())
+                return
+            
+            # Construir URL destino
+            target_url = f"{api_base_url}{upstream_path}"
+            
+            # Altas: retener el slot y rechazar solapes antes de llamar al upstream
+            if method == 'POST':
+                retencion, conflicto = retener_slot(path, body)
+                if conflicto:
+                    status = 409
+                    response_data = json.dumps({
+                        'error': 'El horario seleccionado ya está reservado',
+                        'conflicto': True
+                    }).encode()
+                    # No se guarda con la Idempotency-Key: la retención que lo provoca es temporal
+                    # (si el alta rival falla, el mismo reenvío debe poder reservar el slot)
+                    response_size = self._enviar_respuesta(409, response_data)
+                    return
+            
             # Crear request con headers seguros
             headers = {
                 'Content-Type': 'application/json',
@@ -49,34 +687,89 @@ class handler(BaseHTTPRequestHandler):
             req = Request(target_url, data=body, headers=headers, method=method)
             
             # Ejecutar petición
-            with urlopen(req) as response:
-                response_data = response.read()
-                
-                # Enviar respuesta al cliente
-                origin = self.headers.get('Origin', '')
-                allowed_origins = ['https://tablet.arvera.es', 'https://citas.arvera.es', 'http://localhost:3000', 'http://localhost:5173']
-                
-                self.send_response(response.status)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', origin if origin in allowed_origins else 'https://tablet.arvera.es')
-                self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-                self.end_headers()
-                self.wfile.write(response_data)
+            inicio = time.perf_counter()
+            try:
+                with urlopen(req) as response:
+                    response_data = response.read()
+                    status = response.status
+            finally:
+                upstream_ms = (time.perf_counter() - inicio) * 1000
+            
+            # Actualizar el índice de reservas (la retención pasa a ser la cita creada)
+            if retencion:
+                try:
+                    _reservas.confirmar(retencion, json.loads(response_data))
+                except ValueError:
+                    pass
+                retencion = None
+            if 200 <= status < 300:
+                actualizar_indice(method, upstream_path, body, response_data)
+            
+            if turno:
+                _idempotencia.guardar(idempotencia, turno, huella, status, response_data)
+            
+            extra_headers = {}
+            notificar = (method in ('POST', 'PUT', 'DELETE') and 200 <= status < 300
+                         and path.startswith('/citas') and notificaciones_activas())
+            if notificar and notificacion_en_cliente():
+                extra_headers['X-Notificar-Cambio'] = '1'
+                notificar = False
+            if opciones_listado and status == 200:
+                response_data, siguiente = aplicar_opciones_listado(response_data, opciones_listado)
+                if siguiente:
+                    extra_headers['X-Next-Cursor'] = siguiente
+            
+            # Enviar respuesta al cliente
+            response_size = self._enviar_respuesta(status, response_data, extra_headers)
+            
+            # Notificar escrituras confirmadas sin hacer esperar al cliente
+            if notificar:
+                notificar_cambio(method, path)
                 
         except HTTPError as e:
             # Propagar errores HTTP
+            status = e.code
             self.send_response(e.code)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
             error_msg = e.read()
             self.wfile.write(error_msg)
+            response_size = len(error_msg)
+            # Los rechazos definitivos (4xx) también se repiten tal cual; los 5xx se pueden reintentar
+            if turno and e.code < 500:
+                _idempotencia.guardar(idempotencia, turno, huella, e.code, error_msg)
             
         except Exception as e:
             # Error interno
+            status = 500
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({'error': str(e)}).encode())
+        
+        finally:
+            if retencion:
+                _reservas.liberar(retencion)
+            if turno:
+                # Sin respuesta guardada (5xx, error de red): un reintento vuelve a intentarlo
+                _idempotencia.soltar(idempotencia, turno)
+            registrar_captura(method, path, len(body) if body else 0, status, upstream_ms, response_size)
+    
+    def _enviar_respuesta(self, status, data, extra_headers=None):
+        """Envía una respuesta JSON con cabeceras CORS; devuelve los bytes escritos"""
+        origin = self.headers.get('Origin', '')
+        allowed_origins = ['https://tablet.arvera.es', 'https://citas.arvera.es', 'http://localhost:3000', 'http://localhost:5173']
+        
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', origin if origin in allowed_origins else 'https://tablet.arvera.es')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
+        self.send_header('Access-Control-Expose-Headers', 'X-Next-Cursor, Idempotent-Replayed, X-Notificar-Cambio')
+        for nombre, valor in (extra_headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(data)
+        return len(data)
     
     def do_OPTIONS(self):
         """Manejar preflight CORS"""
@@ -86,5 +779,5 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', origin if origin in allowed_origins else 'https://tablet.arvera.es')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key')
         self.end_headers()
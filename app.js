@@ -112,6 +112,10 @@ class ApiService {
         ...options,
         headers
       });
+      // En serverless el proxy no puede notificar sin retrasar la respuesta: lo pide al cliente
+      if (response.headers.get('X-Notificar-Cambio')) {
+        this.notificarCambio();
+      }
       return response;
     } catch (error) {
       console.error('Error en fetch:', error);
@@ -119,7 +123,20 @@ class ApiService {
     }
   }
 
-  async getCitas(startDate = null, endDate = null, estado = null) {
+  notificarCambio() {
+    // Notificar al webhook que hubo un cambio, sin esperar su respuesta
+    fetch(CONFIG.WEBHOOK_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      keepalive: true,
+      body: JSON.stringify({
+        triggerEvent: 'CITA_CHANGED',
+        createdAt: new Date().toISOString()
+      })
+    }).catch(error => console.error('Error notificando cambio:', error));
+  }
+
+  async getCitas(startDate = null, endDate = null, estado = null, fields = null) {
     // Usar proxy en lugar de llamada directa a la API
     let url = `/api/proxy/citas`;
     const params = [];
@@ -130,6 +147,10 @@ class ApiService {
     if (estado) {
       params.push(`estado=${encodeURIComponent(estado)}`);
     }
+    if (fields) {
+      // Proyección en el proxy: solo se transfieren los campos indicados
+      params.push(`fields=${encodeURIComponent(fields.join(','))}`);
+    }
     if (params.length > 0) {
       url += `?${params.join('&')}`;
     }
@@ -154,9 +175,30 @@ class ApiService {
     }));
   }
 
-  async agendarCita(datos) {
+  async getAgenda(desde, dias, version = null) {
+    // Agenda pre-renderizada en el servidor: citas normalizadas y agrupadas por día y slot
+    const headers = version ? { 'If-None-Match': `"${version}"` } : {};
+    const res = await this.fetch(`/api/agenda?desde=${encodeURIComponent(desde)}&dias=${dias}`, { headers });
+    // 304: la semana no ha cambiado desde la versión indicada
+    if (res.status === 304) return null;
+    if (!res.ok) {
+      const error = new Error('Error al obtener la agenda');
+      // 503 del Service Worker: no hay red (no es un error del servidor)
+      error.sinConexion = res.status === 503 && res.headers.get('X-Offline-Store') === 'offline';
+      throw error;
+    }
+    return res.json();
+  }
+
+  nuevaIdempotencyKey() {
+    // Clave de una escritura: si se reenvía con la misma clave, el proxy no la repite
+    return crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+  }
+
+  async agendarCita(datos, idempotencyKey = this.nuevaIdempotencyKey()) {
     const res = await this.fetch(`/api/proxy/citas`, {
       method: 'POST',
+      headers: { 'Idempotency-Key': idempotencyKey },
       body: JSON.stringify({
         Nombre: datos.name,
         Telefono: datos.phone,
@@ -175,6 +217,7 @@ class ApiService {
   async actualizarCita(citaId, datos) {
     const res = await this.fetch(`/api/proxy/citas/${citaId}`, {
       method: 'PUT',
+      headers: { 'Idempotency-Key': this.nuevaIdempotencyKey() },
       body: JSON.stringify(datos)
     });
     return res;
@@ -182,7 +225,8 @@ class ApiService {
 
   async eliminarCita(citaId) {
     const res = await this.fetch(`/api/proxy/citas/${citaId}`, {
-      method: 'DELETE'
+      method: 'DELETE',
+      headers: { 'Idempotency-Key': this.nuevaIdempotencyKey() }
     });
     return res;
   }
@@ -560,6 +604,11 @@ class CalendarioApp {
     this.citas = [];
     this.draggedCita = null;
 
+    // Agenda semanal del servidor (citas agrupadas por día/slot) y cache por semana
+    this.agenda = null;
+    this.agendaSlots = new Map();
+    this.agendas = {};
+
     // Servicios
     this.api = new ApiService();
     this.storage = new StorageService();
@@ -695,22 +744,6 @@ class CalendarioApp {
     }
   }
 
-  async notificarCambio() {
-    // Notificar al webhook que hubo un cambio
-    try {
-      await fetch(CONFIG.WEBHOOK_URL, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          triggerEvent: 'CITA_CHANGED',
-          createdAt: new Date().toISOString()
-        })
-      });
-    } catch (error) {
-      console.error('Error notificando cambio:', error);
-    }
-  }
-
   startAutoRefresh() {
     // DEPRECATED: Usar startWebhookPolling() en su lugar
     this.startWebhookPolling();
@@ -819,18 +852,40 @@ class CalendarioApp {
       // Generar los días laborables que se mostrarán en el calendario
       const diasLaborables = this.diasLaborablesService.generarDiasLaborables(this.currentWeek, 7);
       
-      // Obtener la fecha de inicio (primer día laborable) y fin (último día laborable)
-      // Agregamos 1 día extra al final para asegurar que cargue todo el rango visible
       const inicio = diasLaborables[0].format('YYYY-MM-DD');
-      const fin = diasLaborables[diasLaborables.length - 1].add(1, 'day').format('YYYY-MM-DD');
-
-      // Cargar solo citas confirmadas desde la API (ahorra procesamiento)
-      const citas = await this.api.getCitas(inicio, fin, 'Confirmada');
 
-      // Validar que sea un array
-      this.citas = Array.isArray(citas) ? citas : [];
+      // Agenda ya normalizada y agrupada en el servidor; si la semana no ha
+      // cambiado (304) se reutiliza la que ya tenemos sin volver a pintar
+      const cacheada = this.agendas[inicio];
+      let agenda;
+      try {
+        agenda = await this.api.getAgenda(inicio, diasLaborables.length, cacheada?.version) || cacheada;
+      } catch (e) {
+        // Solo sin conexión (fallo de red o 503 del Service Worker); los errores
+        // del servidor (4xx/5xx de /api/agenda) se muestran como errores
+        if (!(e instanceof TypeError || e.sinConexion)) throw e;
+        // El Service Worker sirve /citas desde su almacén local
+        // (incluye las citas guardadas sin conexión pendientes de enviar)
+        const fin = diasLaborables[diasLaborables.length - 1].add(1, 'day').format('YYYY-MM-DD');
+        this.citas = await this.api.getCitas(inicio, fin, 'Confirmada');
+        this.agenda = null;
+        this.agendaSlots = new Map();
+        this.ui.setLastUpdate(`📴 Sin conexión - datos locales ${dayjs().format('HH:mm:ss')}`);
+        this.viewManager.renderVistaActual();
+        this.estadisticasService.render();
+        return;
+      }
+      this.agendas[inicio] = agenda;
 
       this.ui.setLastUpdate(`Última actualización: ${dayjs().format('HH:mm:ss')}`);
+      if (agenda === this.agenda) {
+        return;
+      }
+
+      this.agenda = agenda;
+      this.agendaSlots = new Map(agenda.dias.map(dia => [dia.fecha, dia.slots]));
+      this.citas = Array.isArray(agenda.citas) ? agenda.citas : [];
+
       // Renderizar la vista actual (delegado al ViewManager)
       this.viewManager.renderVistaActual();
       // Actualizar estadísticas
@@ -838,6 +893,8 @@ class CalendarioApp {
     } catch (e) {
       console.error('Error cargando citas:', e);
       this.citas = [];
+      this.agenda = null;
+      this.agendaSlots = new Map();
       this.ui.setLastUpdate('❌ Error al cargar');
       this.ui.showError('Error al cargar las citas');
       this.viewManager.renderVistaActual();
@@ -852,8 +909,9 @@ class CalendarioApp {
 
   async mostrarCitasCanceladas() {
     try {
-      // Cargar citas canceladas (sin filtrar por fechas)
-      const citasCanceladas = await this.api.getCitas(null, null, 'Cancelada');
+      // Cargar citas canceladas (sin filtrar por fechas), solo los campos del listado;
+      // el detalle se pide completo al pulsar sobre una cita
+      const citasCanceladas = await this.api.getCitas(null, null, 'Cancelada', ['Id', 'Nombre', 'Servicio', 'startTime']);
       
       if (citasCanceladas.length === 0) {
         this.ui.showModal('<h3>Historial de Canceladas</h3><p style="text-align:center;color:var(--text-secondary);margin:24px 0;">No hay citas canceladas.</p>');
@@ -1155,8 +1213,7 @@ class CalendarioApp {
         const response = await this.api.eliminarCita(citaId);
         if (response.ok) {
           this.closeModal();
-          // Notificar al webhook que hubo cambios
-          this.notificarCambio();
+          // El webhook se notifica en segundo plano (proxy o ApiService)
           await this.cargarCitas();
         } else {
           alert('Error al cancelar la cita');
@@ -1327,17 +1384,39 @@ class CalendarioApp {
         notes: document.getElementById('notes').value.trim() || ''
       };
 
+      // Reenvíos del mismo formulario (timeout, doble pulsación) usan la misma
+      // Idempotency-Key, así el proxy devuelve la cita ya creada en vez de duplicarla
+      const firma = JSON.stringify(datos);
+      if (this.ultimoAgendamiento?.firma !== firma) {
+        this.ultimoAgendamiento = { firma, clave: this.api.nuevaIdempotencyKey() };
+      }
+
       // Enviar a la API unificada
-      const response = await this.api.agendarCita(datos);
+      const response = await this.api.agendarCita(datos, this.ultimoAgendamiento.clave);
+      // Respuesta definitiva (2xx/4xx): la clave ya está gastada y un nuevo envío de los
+      // mismos datos es otra cita. Solo tras un fallo de red o un 5xx/503 se reutiliza
+      if (response.status < 500) {
+        this.ultimoAgendamiento = null;
+      }
 
-      if (response.ok) {
+      if (response.status === 202) {
+        // Sin conexión: el Service Worker la enviará al recuperar la red
+        mensajes.innerHTML = '<div class="success-message" style="display:block;">✓ Cita guardada sin conexión. Se enviará al recuperar la red.</div>';
+        setTimeout(async () => {
+          this.closeModal();
+          await this.cargarCitas();
+        }, 1500);
+      } else if (response.ok) {
         mensajes.innerHTML = '<div class="success-message" style="display:block;">✓ Cita agendada correctamente</div>';
-        // Notificar al webhook que hubo cambios
-        this.notificarCambio();
+        // El webhook se notifica en segundo plano (proxy o ApiService)
         setTimeout(async () => {
           this.closeModal();
           await this.cargarCitas();
         }, 1500);
+      } else if (response.status === 409) {
+        // Horario ocupado por otra reserva (detectado por el proxy)
+        this.cargarCitas();
+        throw new Error('Este horario ya está ocupado. Elige otro hueco.');
       } else {
         const errorData = await response.text();
         console.error('Error del servidor:', errorData);
@@ -1392,4 +1471,24 @@ if ('serviceWorker' in navigator && location.protocol !== 'file:') {
         console.log('✗ Error al registrar Service Worker:', error);
       });
   });
+
+  // Avisos del Service Worker: datos locales revalidados o cambios offline rechazados
+  navigator.serviceWorker.addEventListener('message', event => {
+    if (event.data?.tipo === 'citas-actualizadas') {
+      window.app?.verificarActualizaciones();
+    } else if (event.data?.tipo === 'notificar-cambio') {
+      // Cambios offline ya enviados: avisar al webhook en nombre del Service Worker
+      window.app?.api.notificarCambio();
+    } else if (event.data?.tipo === 'salida-rechazada') {
+      window.app?.ui.showError(event.data.status === 409
+        ? 'Una cita guardada sin conexión no se pudo enviar: el horario ya estaba ocupado'
+        : 'Un cambio guardado sin conexión fue rechazado por el servidor');
+      window.app?.verificarActualizaciones();
+    }
+  });
+
+  // Al recuperar la red, reenviar los cambios pendientes (navegadores sin Background Sync)
+  window.addEventListener('online', () => {
+    navigator.serviceWorker.controller?.postMessage({ tipo: 'reenviar-salida' });
+  });
 }
@@ -121,6 +121,14 @@ class CalendarioView {
    * Busca una cita que coincida con el slot
    */
   buscarCitaEnSlot(fecha, hora) {
+    // Agenda del servidor: la cita ya viene asignada a su slot
+    const slots = this.app.agendaSlots.get(fecha);
+    const indiceHora = this.app.agenda ? this.app.agenda.horarios.indexOf(hora) : -1;
+    if (slots && indiceHora !== -1) {
+      const indiceCita = slots[indiceHora];
+      return indiceCita === undefined ? undefined : this.app.citas[indiceCita];
+    }
+
     return this.app.citas.find(c => {
       if (!c.start) return false;
       const citaFechaHora = dayjs.utc(c.start).tz(CONFIG.TIMEZONE);
@@ -220,8 +228,7 @@ class CalendarioView {
       });
       
       if (response.ok) {
-        // Notificar al webhook que hubo cambios
-        this.app.notificarCambio();
+        // El webhook se notifica en segundo plano (proxy o ApiService)
         // Recargar citas desde API para tener datos frescos
         await this.app.cargarCitas();
       } else {
@@ -449,12 +449,32 @@ class ReservasPublicas {
         Notas: document.getElementById('notes').value.trim() || ''
       };
 
-      const response = await fetch(`/api/proxy/citas`, {
+      // Misma Idempotency-Key para los reenvíos de estos datos (timeout, doble envío):
+      // el proxy devuelve la reserva ya creada en lugar de duplicarla
+      const cuerpo = JSON.stringify(datos);
+      if (this.ultimaReserva?.cuerpo !== cuerpo) {
+        const clave = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+        this.ultimaReserva = { cuerpo, clave };
+      }
+      const enviar = () => fetch(`/api/proxy/citas`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(datos)
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': this.ultimaReserva.clave },
+        body: cuerpo
       });
 
+      let response;
+      try {
+        response = await enviar();
+      } catch (error) {
+        // Fallo de red: reintentar una vez, es seguro gracias a la Idempotency-Key
+        response = await enviar();
+      }
+      // Respuesta definitiva (2xx/4xx): la clave ya está gastada y un nuevo envío de los
+      // mismos datos es otra reserva. Solo tras un 5xx/503 se reenvía con la misma clave
+      if (response.status < 500) {
+        this.ultimaReserva = null;
+      }
+
       if (response.ok) {
         mensajes.innerHTML = `
           <div style="background:#d4edda;border:1px solid #c3e6cb;color:#155724;padding:16px;border-radius:8px;margin-bottom:16px;display:flex;align-items:center;gap:12px;">
@@ -463,18 +483,17 @@ class ReservasPublicas {
           </div>
         `;
         
-        // Notificar webhook
-        try {
-          await fetch(CONFIG.WEBHOOK_URL, {
+        // En serverless el proxy pide al cliente que notifique la reserva (sin esperar al webhook)
+        if (response.headers.get('X-Notificar-Cambio')) {
+          fetch(CONFIG.WEBHOOK_URL, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
+            keepalive: true,
             body: JSON.stringify({
               triggerEvent: 'CITA_CHANGED',
               createdAt: new Date().toISOString()
             })
-          });
-        } catch (error) {
-          console.error('Error notificando cambio:', error);
+          }).catch(error => console.error('Error notificando cambio:', error));
         }
         
         // Limpiar cache y recargar
@@ -488,6 +507,15 @@ class ReservasPublicas {
             this.renderSlots();
           });
         }, 2500);
+      } else if (response.status === 409) {
+        // Otro cliente acaba de reservar este horario: refrescar los slots del mes
+        const monthKey = this.currentMonth.format('YYYY-MM');
+        delete this.slotsCache[monthKey];
+        this.loadMonthSlots().then(() => {
+          this.renderCalendar();
+          this.renderSlots();
+        });
+        throw new Error('Este horario acaba de ser reservado. Por favor, elige otro.');
       } else {
         const errorData = await response.text();
         throw new Error(errorData || 'Error al realizar la reserva');
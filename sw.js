@@ -1,4 +1,4 @@
-const CACHE_NAME = 'arvera-citas-v1';
+const CACHE_NAME = 'arvera-citas-v2';
 const urlsToCache = [
   '/',
   '/index.html',
@@ -9,6 +9,21 @@ const urlsToCache = [
   'https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap'
 ];
 
+// Almacén local de citas (IndexedDB)
+// - citas:     citas en formato de la API, indexadas por fecha de inicio
+// - consultas: URLs de GET /citas ya sincronizadas (se pueden servir al instante)
+//              y la última respuesta de cada /api/agenda?desde=&dias=
+// - salida:    escrituras hechas sin conexión, pendientes de reenviar
+const DB_NAME = 'arvera-citas';
+const DB_VERSION = 1;
+const SYNC_TAG = 'citas-salida';
+const RUTA_CITAS = '/api/proxy/citas';
+const RUTA_AGENDA = '/api/agenda';
+// Con Wi-Fi inestable una petición puede quedarse colgada: pasado este tiempo se
+// usa el almacén (lecturas) o la cola de salida (escrituras, seguras por su Idempotency-Key)
+const TIMEOUT_LECTURA = 3000;
+const TIMEOUT_ESCRITURA = 10000;
+
 // Instalación del Service Worker
 self.addEventListener('install', event => {
   event.waitUntil(
@@ -38,8 +53,426 @@ self.addEventListener('activate', event => {
   self.clients.claim();
 });
 
-// Estrategia: Network First, fallback a Cache
+/****************************************
+ * INDEXEDDB
+ ****************************************/
+
+let dbPromise = null;
+
+function abrirDB() {
+  if (!dbPromise) {
+    dbPromise = new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB_NAME, DB_VERSION);
+      req.onupgradeneeded = () => {
+        const db = req.result;
+        const citas = db.createObjectStore('citas', { keyPath: 'Id' });
+        citas.createIndex('fecha', '_fecha');
+        db.createObjectStore('consultas', { keyPath: 'url' });
+        db.createObjectStore('salida', { keyPath: 'seq', autoIncrement: true });
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+  return dbPromise;
+}
+
+// Ejecuta `fn(stores)` en una transacción y resuelve con su resultado al completarse
+async function transaccion(nombres, modo, fn) {
+  const db = await abrirDB();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(nombres, modo);
+    const stores = Object.fromEntries([].concat(nombres).map(n => [n, tx.objectStore(n)]));
+    let resultado;
+    Promise.resolve(fn(stores)).then(r => { resultado = r; });
+    tx.oncomplete = () => resolve(resultado);
+    tx.onerror = () => reject(tx.error);
+    tx.onabort = () => reject(tx.error);
+  });
+}
+
+function peticionIDB(req) {
+  return new Promise((resolve, reject) => {
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+// Instante (ms) de una fecha YYYY-MM-DD o ISO 8601
+function instante(valor, finDeDia = false) {
+  if (!valor) return null;
+  const iso = valor.length === 10 ? `${valor}T${finDeDia ? '23:59:59' : '00:00:00'}Z` : valor;
+  const ms = Date.parse(iso);
+  return Number.isNaN(ms) ? null : ms;
+}
+
+function conFecha(cita) {
+  return { ...cita, _fecha: instante(cita.startTime) || 0 };
+}
+
+function sinFecha(cita) {
+  const { _fecha, ...resto } = cita;
+  return resto;
+}
+
+// Filtros de una URL de GET /citas
+function filtrosConsulta(url) {
+  const params = new URL(url).searchParams;
+  return {
+    desde: instante(params.get('startDate')),
+    hasta: instante(params.get('endDate'), true),
+    estado: params.get('estado')
+  };
+}
+
+async function leerCitasLocales({ desde, hasta, estado }) {
+  const citas = await transaccion('citas', 'readonly', ({ citas }) => {
+    const rango = desde !== null && hasta !== null ? IDBKeyRange.bound(desde, hasta) : null;
+    return peticionIDB(citas.index('fecha').getAll(rango));
+  });
+  return citas
+    .filter(c => !estado || c.Estado === estado)
+    .map(sinFecha);
+}
+
+/**
+ * Sustituye en el almacén las citas de una consulta por las recibidas del servidor.
+ * Las citas locales del rango (y estado) que ya no vienen se eliminan.
+ * Devuelve true si ha cambiado algo.
+ */
+async function sincronizarCitas(citas, { desde, hasta, estado }, url = null) {
+  return transaccion(['citas', 'consultas'], 'readwrite', async ({ citas: store, consultas }) => {
+    const rango = desde !== null && hasta !== null ? IDBKeyRange.bound(desde, hasta) : null;
+    const locales = await peticionIDB(store.index('fecha').getAll(rango));
+    const recibidas = new Map(citas.map(c => [c.Id, c]));
+    let cambios = false;
+
+    locales.forEach(local => {
+      if (estado && local.Estado !== estado) return;
+      // Las citas provisionales (creadas sin conexión) se mantienen hasta reenviarse
+      if (!recibidas.has(local.Id) && !local._pendiente) {
+        store.delete(local.Id);
+        cambios = true;
+      }
+    });
+
+    const porId = new Map(locales.map(c => [c.Id, c]));
+    citas.forEach(cita => {
+      const anterior = porId.get(cita.Id);
+      if (!anterior || JSON.stringify(sinFecha(anterior)) !== JSON.stringify(cita)) {
+        store.put(conFecha(cita));
+        cambios = true;
+      }
+    });
+
+    if (url) {
+      consultas.put({ url, sincronizada: Date.now() });
+    }
+    return cambios;
+  });
+}
+
+// La agenda (/api/agenda) trae las citas normalizadas: volver al formato de la API
+function citaDesdeAgenda(c) {
+  return {
+    Id: c.id,
+    startTime: c.start,
+    endTime: c.end,
+    Nombre: c.name,
+    Telefono: c.phone,
+    Email: c.email,
+    Servicio: c.service,
+    Matricula: c.matricula,
+    Modelo: c.modelo,
+    Notas: c.notes,
+    Estado: c.estado,
+    CancelToken: c.cancelToken
+  };
+}
+
+async function avisarClientes(mensaje) {
+  const clientes = await self.clients.matchAll({ includeUncontrolled: true });
+  clientes.forEach(cliente => cliente.postMessage(mensaje));
+}
+
+function fetchConTimeout(recurso, opciones = {}, ms = TIMEOUT_LECTURA) {
+  const control = new AbortController();
+  const temporizador = setTimeout(() => control.abort(), ms);
+  return fetch(recurso, { ...opciones, signal: control.signal }).finally(() => clearTimeout(temporizador));
+}
+
+function respuestaJSON(datos, status = 200, headers = {}) {
+  return new Response(JSON.stringify(datos), {
+    status,
+    headers: { 'Content-Type': 'application/json', ...headers }
+  });
+}
+
+/****************************************
+ * LECTURAS: almacén local + revalidación
+ ****************************************/
+
+async function revalidarCitas(request) {
+  const response = await fetchConTimeout(request);
+  if (response.ok) {
+    const citas = await response.clone().json();
+    if (Array.isArray(citas)) {
+      const cambios = await sincronizarCitas(citas, filtrosConsulta(request.url), request.url);
+      if (cambios) {
+        avisarClientes({ tipo: 'citas-actualizadas' });
+      }
+    }
+    reenviarSalida();
+  }
+  return response;
+}
+
+async function leerCitas(event) {
+  const request = event.request;
+  const filtros = filtrosConsulta(request.url);
+  const consulta = await transaccion('consultas', 'readonly', ({ consultas }) => peticionIDB(consultas.get(request.url)))
+    .catch(() => null);
+
+  // Consulta ya sincronizada: responder al instante y revalidar en segundo plano
+  if (consulta) {
+    const locales = await leerCitasLocales(filtros);
+    event.waitUntil(revalidarCitas(request).catch(() => {}));
+    return respuestaJSON(locales, 200, { 'X-Offline-Store': 'hit' });
+  }
+
+  try {
+    return await revalidarCitas(request);
+  } catch (error) {
+    // Sin conexión: lo que haya en el almacén (incluye cambios pendientes)
+    const locales = await leerCitasLocales(filtros);
+    return respuestaJSON(locales, 200, { 'X-Offline-Store': 'offline' });
+  }
+}
+
+// Clave de una agenda en `consultas`: solo cuentan desde y dias
+function claveAgenda(url) {
+  const params = new URL(url).searchParams;
+  return `${self.location.origin}${RUTA_AGENDA}?desde=${params.get('desde')}&dias=${params.get('dias')}`;
+}
+
+// Pide la agenda a la red; con 200 guarda la respuesta y alimenta el almacén de citas
+async function revalidarAgenda(url, etag = null) {
+  const response = await fetchConTimeout(url, { headers: etag ? { 'If-None-Match': etag } : {} });
+  if (response.status !== 200) {
+    return response;
+  }
+  const agenda = await response.clone().json();
+  await transaccion('consultas', 'readwrite', ({ consultas }) => {
+    consultas.put({ url: claveAgenda(url), sincronizada: Date.now(), agenda });
+  });
+  // Solo se sincronizan los días laborables de la agenda: el día siguiente a `hasta` puede venir incompleto
+  await sincronizarCitas(
+    agenda.citas.map(citaDesdeAgenda),
+    { desde: instante(agenda.desde), hasta: instante(agenda.hasta, true), estado: 'Confirmada' }
+  ).catch(() => {});
+  return response;
+}
+
+async function leerAgenda(event) {
+  const request = event.request;
+  const guardada = await transaccion('consultas', 'readonly', ({ consultas }) => peticionIDB(consultas.get(claveAgenda(request.url))))
+    .catch(() => null);
+
+  // Semana ya descargada: responder al instante y revalidar en segundo plano
+  if (guardada?.agenda) {
+    const etag = `"${guardada.agenda.version}"`;
+    event.waitUntil(
+      revalidarAgenda(request.url, etag)
+        .then(response => {
+          if (response.status === 200) {
+            avisarClientes({ tipo: 'citas-actualizadas' });
+          }
+        })
+        .catch(() => {})
+    );
+    if (request.headers.get('If-None-Match') === etag) {
+      return new Response(null, { status: 304, headers: { ETag: etag, 'X-Offline-Store': 'hit' } });
+    }
+    return respuestaJSON(guardada.agenda, 200, { ETag: etag, 'X-Offline-Store': 'hit' });
+  }
+
+  try {
+    return await revalidarAgenda(request.url, request.headers.get('If-None-Match'));
+  } catch (error) {
+    // Sin conexión (o sin respuesta a tiempo): la app recurre a GET /citas, servido desde el almacén
+    return respuestaJSON({ error: 'Sin conexión' }, 503, { 'X-Offline-Store': 'offline' });
+  }
+}
+
+/****************************************
+ * ESCRITURAS: cola de salida con Idempotency-Key
+ ****************************************/
+
+function nuevaClave() {
+  return self.crypto?.randomUUID ? self.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+function idDeRuta(url) {
+  const partes = new URL(url).pathname.split('/').filter(Boolean);
+  return partes.length > 3 ? decodeURIComponent(partes[3]) : null;
+}
+
+// La API puede devolver la cita tal cual o envuelta en { mensaje, cita }
+function extraerCita(respuesta) {
+  const cita = respuesta?.cita || respuesta;
+  return cita && cita.Id ? cita : null;
+}
+
+/**
+ * Refleja una escritura en el almacén. `respuesta` es la respuesta del servidor a
+ * una escritura confirmada (2xx, puede ser null si no trae JSON) o undefined si la
+ * escritura se ha encolado sin conexión.
+ */
+async function aplicarEscritura(method, url, datos, respuesta, clave) {
+  const id = idDeRuta(url);
+  const confirmada = respuesta !== undefined;
+  const cita = confirmada ? extraerCita(respuesta) : null;
+  await transaccion(['citas', 'consultas'], 'readwrite', async ({ citas, consultas }) => {
+    // Las agendas guardadas ya no reflejan el cambio: la siguiente lectura va a la red
+    // (o, sin conexión, a GET /citas, que sí incluye las citas pendientes)
+    const prefijo = `${self.location.origin}${RUTA_AGENDA}?`;
+    consultas.delete(IDBKeyRange.bound(prefijo, `${prefijo}\uffff`));
+
+    if (method === 'POST') {
+      if (!confirmada) {
+        citas.put(conFecha({ ...datos, Id: `local-${clave}`, Estado: 'Confirmada', _pendiente: true }));
+        return;
+      }
+      // Confirmada: la provisional sobra; la cita real llega en la respuesta o en la próxima sincronización
+      citas.delete(`local-${clave}`);
+      if (cita) {
+        citas.put(conFecha(cita));
+      }
+    } else if (id) {
+      const actual = await peticionIDB(citas.get(id));
+      if (!actual) return;
+      const cambios = method === 'DELETE' ? { Estado: 'Cancelada' } : (cita || datos);
+      citas.put(conFecha({ ...actual, ...cambios }));
+    }
+  });
+}
+
+async function escribir(request) {
+  const body = request.method === 'DELETE' ? null : await request.clone().text();
+  const clave = request.headers.get('Idempotency-Key') || nuevaClave();
+  const headers = { 'Content-Type': 'application/json', 'Idempotency-Key': clave };
+  const datos = body ? JSON.parse(body) : null;
+
+  try {
+    const response = await fetchConTimeout(request.url, { method: request.method, headers, body }, TIMEOUT_ESCRITURA);
+    if (response.ok) {
+      const respuesta = await response.clone().json().catch(() => null);
+      await aplicarEscritura(request.method, request.url, datos, respuesta, clave).catch(() => {});
+      reenviarSalida();
+    }
+    return response;
+  } catch (error) {
+    // Sin conexión o sin respuesta a tiempo: encolar y aplicar el cambio en local
+    await transaccion('salida', 'readwrite', ({ salida }) => {
+      salida.add({ url: request.url, method: request.method, body, clave, creada: Date.now() });
+    });
+    await aplicarEscritura(request.method, request.url, datos, undefined, clave).catch(() => {});
+    if (self.registration.sync) {
+      self.registration.sync.register(SYNC_TAG).catch(() => {});
+    }
+    return respuestaJSON({ encolada: true, idempotencyKey: clave }, 202);
+  }
+}
+
+let reenviando = null;
+
+// Reenvía la cola en orden; se detiene al primer fallo de red o 5xx
+function reenviarSalida() {
+  if (!reenviando) {
+    reenviando = (async () => {
+      const pendientes = await transaccion('salida', 'readonly', ({ salida }) => peticionIDB(salida.getAll()));
+      let enviadas = 0;
+      let notificar = false;
+      for (const item of pendientes) {
+        let response;
+        try {
+          response = await fetchConTimeout(item.url, {
+            method: item.method,
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': item.clave },
+            body: item.body
+          }, TIMEOUT_ESCRITURA);
+        } catch (error) {
+          break;
+        }
+        if (response.status >= 500) break;
+
+        await transaccion('salida', 'readwrite', ({ salida }) => { salida.delete(item.seq); });
+        enviadas++;
+        notificar = notificar || Boolean(response.headers.get('X-Notificar-Cambio'));
+        if (response.ok) {
+          const respuesta = await response.json().catch(() => null);
+          await aplicarEscritura(item.method, item.url, item.body ? JSON.parse(item.body) : null, respuesta, item.clave)
+            .catch(() => {});
+        } else {
+          // Rechazo definitivo (p. ej. 409 horario ocupado): no tiene sentido reintentar
+          if (item.method === 'POST') {
+            await transaccion('citas', 'readwrite', ({ citas }) => { citas.delete(`local-${item.clave}`); });
+          }
+          avisarClientes({ tipo: 'salida-rechazada', status: response.status, method: item.method });
+        }
+      }
+      if (enviadas > 0) {
+        avisarClientes({ tipo: 'citas-actualizadas' });
+      }
+      if (notificar) {
+        // El Service Worker no conoce WEBHOOK_URL (llega con /api/env): lo notifica la app
+        avisarClientes({ tipo: 'notificar-cambio' });
+      }
+    })().catch(() => {}).finally(() => { reenviando = null; });
+  }
+  return reenviando;
+}
+
+self.addEventListener('sync', event => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(reenviarSalida());
+  }
+});
+
+self.addEventListener('message', event => {
+  if (event.data?.tipo === 'reenviar-salida') {
+    event.waitUntil(reenviarSalida());
+  }
+});
+
+/****************************************
+ * FETCH
+ ****************************************/
+
 self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+
+  // Citas: almacén local con revalidación y cola de escrituras offline
+  if (url.origin === self.location.origin && url.pathname.startsWith(RUTA_CITAS)) {
+    const esListado = url.pathname === RUTA_CITAS;
+    const esPaginado = ['fields', 'limit', 'after'].some(p => url.searchParams.has(p));
+    if (event.request.method === 'GET' && esListado && !esPaginado) {
+      event.respondWith(leerCitas(event));
+      return;
+    }
+    if (['POST', 'PUT', 'DELETE'].includes(event.request.method)) {
+      event.respondWith(escribir(event.request));
+      return;
+    }
+  }
+
+  // Agenda: última respuesta guardada al instante y revalidación en segundo plano;
+  // sin ella y sin red, la app usa GET /citas
+  if (url.origin === self.location.origin && url.pathname === RUTA_AGENDA && event.request.method === 'GET') {
+    event.respondWith(leerAgenda(event));
+    return;
+  }
+
   // Solo cachear GET requests
   if (event.request.method !== 'GET') {
     return;
@@ -51,6 +484,7 @@ self.addEventListener('fetch', event => {
     return;
   }
 
+  // Estrategia: Network First, fallback a Cache
   event.respondWith(
     fetch(event.request)
       .then(response => {
@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+"""
+Benchmark reproducible del proxy (api/proxy.py) y del endpoint de configuración (api/env.py)
+
+Levanta ambos handlers en local con http.server, delante de una API upstream
+simulada con latencia y tamaño de respuesta configurables, y reproduce mezclas
+de tráfico realistas a una concurrencia fija:
+
+- tablet:   polling de la semana visible (GET /citas) y recarga de /api/env
+- reservas: escaneo mensual de slots del widget (GET /disponibles)
+- rafaga:   ráfaga de reservas, cada una a un slot libre distinto (POST /citas); debe acabar sin 409
+- conflicto: reservas concurrentes sobre los mismos 5 slots; debe acabar sin dobles reservas
+- reintentos: altas reenviadas con la misma Idempotency-Key; debe acabar sin 409 ni duplicados
+- agenda:   polling de la tablet con la agenda pre-renderizada (GET /api/agenda con ETag)
+- ocupacion: vista de ocupación que solo pide startTime/endTime/Estado (fields=)
+- historial: páginas del historial de canceladas (limit/after, con los cursores X-Next-Cursor reales)
+- mixto:    combinación ponderada de las anteriores
+
+Reporta throughput, percentiles de latencia y memoria, y guarda el resultado
+en JSON para comparar versiones:
+
+    python test/benchmark_proxy.py --salida bench_nuevo.json
+    python test/benchmark_proxy.py --salida bench_nuevo.json --comparar bench_base.json
+
+Solo usa la librería estándar.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+CONFIG_TOKEN = 'bench-config-token'
+HORARIOS = [('08:30', '12:15'), ('15:45', '18:00')]
+DURACION_CITA = 45
+FECHA_BASE = '2026-03-02'  # Lunes; fija para que las ejecuciones sean comparables
+SEMANAS = 8
+
+SERVICIOS = ['Neumáticos', 'Alineación', 'Neumáticos, Alineación']
+NOMBRES = ['Juan Pérez', 'María López', 'Antonio García', 'Lucía Martín', 'Carlos Ruiz']
+MODELOS = ['Seat León', 'Ford Focus', 'Toyota Corolla', 'Renault Clio', 'VW Golf']
+
+
+# ============================================================
+# Utilidades
+# ============================================================
+
+def cargar_handler(nombre):
+    """Carga la clase `handler` de api/<nombre>.py sin necesidad de paquete"""
+    ruta = RAIZ / 'api' / f'{nombre}.py'
+    spec = importlib.util.spec_from_file_location(f'bench_api_{nombre}', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo.handler
+
+
+class ServidorLocal(ThreadingHTTPServer):
+    daemon_threads = True
+    # El backlog por defecto (5) provoca reintentos SYN de 1 s con alta concurrencia
+    request_queue_size = 256
+
+
+def iniciar_servidor(handler_cls):
+    """Arranca un ServidorLocal en un puerto libre y devuelve (servidor, url_base)"""
+    servidor = ServidorLocal(('127.0.0.1', 0), handler_cls)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    host, puerto = servidor.server_address[:2]
+    return servidor, f'http://{host}:{puerto}'
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[indice]
+
+
+def rss_maximo_mb():
+    """Pico de memoria residente del proceso (MB), si la plataforma lo permite"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return round(rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def slots_del_dia(fecha, duracion=DURACION_CITA):
+    """Inicios de slot (datetime UTC) de un día según HORARIOS"""
+    slots = []
+    for inicio, fin in HORARIOS:
+        t = datetime.fromisoformat(f'{fecha}T{inicio}:00+00:00')
+        limite = datetime.fromisoformat(f'{fecha}T{fin}:00+00:00')
+        while t + timedelta(minutes=duracion) <= limite:
+            slots.append(t)
+            t += timedelta(minutes=duracion)
+    return slots
+
+
+def dias_laborables(inicio, cantidad):
+    dias = []
+    dia = inicio
+    while len(dias) < cantidad:
+        if dia.weekday() < 5:
+            dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
+
+def iso(dt):
+    return dt.isoformat()
+
+
+# ============================================================
+# API upstream simulada
+# ============================================================
+
+class UpstreamSimulado:
+    """
+    Imita la API de citas (GET/POST /citas, GET/PUT/DELETE /citas/{id},
+    GET /disponibles) con latencia y tamaño de payload configurables.
+    También recibe en POST /webhook las notificaciones que envía el proxy.
+    """
+
+    def __init__(self, latencia_ms=40, jitter_ms=10, num_citas=300, relleno=0, semilla=1, libres_minimos=0,
+                 webhook_ms=0):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.num_citas = num_citas
+        self.relleno = relleno
+        self.semilla = semilla
+        self.libres_minimos = libres_minimos
+        self.webhook_ms = webhook_ms
+        self.lock = threading.Lock()
+        self.citas = {}
+        self.peticiones = 0
+        self.notificaciones = 0
+        self.cambios_notificados = 0
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Regenera el dataset de forma determinista"""
+        rng = random.Random(self.semilla)
+        base = datetime.fromisoformat(FECHA_BASE)
+        slots = [s for dia in dias_laborables(base, SEMANAS * 5) for s in slots_del_dia(dia.date())]
+        rng.shuffle(slots)
+        with self.lock:
+            self.citas = {}
+            self.peticiones = 0
+            self.notificaciones = 0
+            self.cambios_notificados = 0
+            for inicio in slots[:self.num_citas]:
+                self._insertar(self._cita_aleatoria(rng, inicio), rng)
+            # Slots que el widget ofrecería como libres (los de las canceladas también)
+            ocupados = {c['startTime'] for c in self.citas.values() if c['Estado'] == 'Confirmada'}
+            self.libres = sorted(s for s in slots if iso(s) not in ocupados)
+            # Días vacíos tras el dataset hasta tener `libres_minimos` slots libres, para que
+            # cada alta de las mezclas de escritura tenga el suyo sin tocar el resto del dataset
+            dias = SEMANAS * 5
+            while len(self.libres) < self.libres_minimos:
+                dia = dias_laborables(base, dias + 1)[-1]
+                self.libres.extend(slots_del_dia(dia.date()))
+                dias += 1
+
+    def contar_solapes(self):
+        """Citas confirmadas que solapan con otra anterior (dobles reservas)"""
+        with self.lock:
+            intervalos = sorted(
+                (_parse_fecha(c['startTime']), _parse_fecha(c['endTime']))
+                for c in self.citas.values() if c['Estado'] == 'Confirmada'
+            )
+        solapes = 0
+        fin_max = None
+        for inicio, fin in intervalos:
+            if fin_max is not None and inicio < fin_max:
+                solapes += 1
+            fin_max = fin if fin_max is None else max(fin_max, fin)
+        return solapes
+
+    def _cita_aleatoria(self, rng, inicio):
+        return {
+            'Nombre': rng.choice(NOMBRES),
+            'Telefono': f'+346{rng.randint(10000000, 99999999)}',
+            'Email': 'cliente@example.com',
+            'Servicio': rng.choice(SERVICIOS),
+            'startTime': iso(inicio),
+            'endTime': iso(inicio + timedelta(minutes=DURACION_CITA)),
+            'Matricula': f'{rng.randint(1000, 9999)}ABC',
+            'Modelo': rng.choice(MODELOS),
+            'Notas': 'x' * self.relleno,
+            'Estado': 'Cancelada' if rng.random() < 0.1 else 'Confirmada',
+        }
+
+    def _insertar(self, datos, rng=None):
+        sufijo = f'{rng.getrandbits(32):08x}' if rng else secrets.token_hex(4)
+        cita_id = f'{datos["startTime"][:19].replace("-", "").replace(":", "").replace("T", "")}-{sufijo}'
+        token = secrets.token_urlsafe(32)
+        cita = {
+            'Id': cita_id,
+            'Nombre': datos.get('Nombre', ''),
+            'Telefono': datos.get('Telefono', ''),
+            'Email': datos.get('Email', ''),
+            'Servicio': datos.get('Servicio', ''),
+            'startTime': datos.get('startTime', ''),
+            'endTime': datos.get('endTime', ''),
+            'Matricula': datos.get('Matricula', ''),
+            'Modelo': datos.get('Modelo', ''),
+            'Notas': datos.get('Notas', ''),
+            'Estado': datos.get('Estado', 'Confirmada'),
+            'Notificacion': 'no enviada',
+            'Recordatorio': 'no enviada',
+            'CancelToken': token,
+            'Url_Cancelacion': f'https://api.example.com/api/cancelar?token={token}',
+        }
+        self.citas[cita_id] = cita
+        return cita
+
+    def esperar(self):
+        retardo = self.latencia_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if retardo > 0:
+            time.sleep(retardo / 1000)
+
+    # --- Endpoints ---
+
+    def listar(self, params):
+        inicio = params.get('startDate')
+        fin = params.get('endDate')
+        estado = params.get('estado')
+        with self.lock:
+            citas = list(self.citas.values())
+        if inicio and fin:
+            desde = _parse_fecha(inicio)
+            hasta = _parse_fecha(fin, fin_de_dia=True)
+            citas = [c for c in citas if desde <= _parse_fecha(c['startTime']) <= hasta]
+        if estado:
+            citas = [c for c in citas if c['Estado'] == estado]
+        return 200, citas
+
+    def disponibles(self, params):
+        duracion = int(params.get('duracion', DURACION_CITA))
+        desde = _parse_fecha(params['startDate']).date()
+        hasta = _parse_fecha(params['endDate']).date()
+        with self.lock:
+            ocupados = {
+                _parse_fecha(c['startTime']) for c in self.citas.values() if c['Estado'] == 'Confirmada'
+            }
+        disponibles = []
+        dia = desde
+        while dia <= hasta:
+            if dia.weekday() < 5:
+                for inicio in slots_del_dia(dia, duracion):
+                    if inicio not in ocupados:
+                        fin = inicio + timedelta(minutes=duracion)
+                        disponibles.append({
+                            'fecha': dia.isoformat(),
+                            'hora_inicio': inicio.strftime('%H:%M'),
+                            'hora_fin': fin.strftime('%H:%M'),
+                            'startTime': iso(inicio),
+                            'endTime': iso(fin),
+                        })
+            dia += timedelta(days=1)
+        return 200, {
+            'total': len(disponibles),
+            'parametros': {'startDate': params['startDate'], 'endDate': params['endDate'], 'duracion': duracion},
+            'disponibles': disponibles,
+        }
+
+    def crear(self, datos):
+        for campo in ('Nombre', 'Telefono', 'Servicio', 'startTime', 'endTime'):
+            if not datos.get(campo):
+                return 400, {'error': f'Campo obligatorio: {campo}'}
+        with self.lock:
+            return 201, self._insertar(datos)
+
+    def actualizar(self, cita_id, datos):
+        with self.lock:
+            cita = self.citas.get(cita_id)
+            if not cita:
+                return 404, {'error': 'Cita no encontrada'}
+            cita.update({k: v for k, v in datos.items() if k != 'Id'})
+            return 200, cita
+
+    def cancelar(self, cita_id):
+        with self.lock:
+            cita = self.citas.get(cita_id)
+            if not cita:
+                return 404, {'error': 'Cita no encontrada'}
+            cita['Estado'] = 'Cancelada'
+            return 200, {'mensaje': 'Cita cancelada correctamente', 'cita': cita}
+
+    def recibir_webhook(self, datos):
+        with self.lock:
+            self.notificaciones += 1
+            self.cambios_notificados += len(datos.get('cambios') or [None])
+        if self.webhook_ms:
+            time.sleep(self.webhook_ms / 1000)
+        return 200, {'ok': True}
+
+    def crear_handler(self):
+        upstream = self
+
+        class UpstreamHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, datos):
+                cuerpo = json.dumps(datos).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _leer_json(self):
+                longitud = int(self.headers.get('Content-Length', 0))
+                if not longitud:
+                    return {}
+                try:
+                    return json.loads(self.rfile.read(longitud))
+                except ValueError:
+                    return {}
+
+            def _despachar(self, method):
+                if self.path == '/webhook' and method == 'POST':
+                    return self._responder(*upstream.recibir_webhook(self._leer_json()))
+                with upstream.lock:
+                    upstream.peticiones += 1
+                upstream.esperar()
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                partes = [p for p in url.path.split('/') if p]
+                if partes[:1] == ['citas'] and len(partes) == 1:
+                    if method == 'GET':
+                        return self._responder(*upstream.listar(params))
+                    if method == 'POST':
+                        return self._responder(*upstream.crear(self._leer_json()))
+                elif partes[:1] == ['citas'] and len(partes) == 2:
+                    if method == 'GET':
+                        cita = upstream.citas.get(partes[1])
+                        return self._responder(200, cita) if cita else self._responder(404, {'error': 'Cita no encontrada'})
+                    if method == 'PUT':
+                        return self._responder(*upstream.actualizar(partes[1], self._leer_json()))
+                    if method == 'DELETE':
+                        return self._responder(*upstream.cancelar(partes[1]))
+                elif partes == ['disponibles'] and method == 'GET':
+                    return self._responder(*upstream.disponibles(params))
+                self._responder(404, {'error': 'Ruta no encontrada'})
+
+            def do_GET(self):
+                self._despachar('GET')
+
+            def do_POST(self):
+                self._despachar('POST')
+
+            def do_PUT(self):
+                self._despachar('PUT')
+
+            def do_DELETE(self):
+                self._despachar('DELETE')
+
+        return UpstreamHandler
+
+
+def _parse_fecha(valor, fin_de_dia=False):
+    """Acepta YYYY-MM-DD o ISO 8601 (con Z u offset) y devuelve datetime UTC"""
+    if len(valor) == 10:
+        hora = 'T23:59:59' if fin_de_dia else 'T00:00:00'
+        return datetime.fromisoformat(f'{valor}{hora}+00:00')
+    dt = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+# ============================================================
+# Entorno local (upstream + proxy + env)
+# ============================================================
+
+class EntornoLocal:
+    """Upstream simulado + api/proxy.py, api/env.py y api/agenda.py sirviendo en 127.0.0.1"""
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.servidor_upstream = None
+        self.servidores = []
+
+    def __enter__(self):
+        self.servidor_upstream, self.upstream_url = iniciar_servidor(self.upstream.crear_handler())
+
+        # Los handlers leen el entorno en cada petición
+        os.environ['API_BASE_URL'] = self.upstream_url
+        os.environ['API_KEY'] = 'bench-api-key'
+        os.environ['CONFIG_TOKEN'] = CONFIG_TOKEN
+        os.environ['WEBHOOK_URL'] = f'{self.upstream_url}/webhook'
+
+        self._arrancar_handlers()
+        return self
+
+    def _arrancar_handlers(self):
+        # Módulos recién cargados: el estado en memoria del proxy empieza vacío
+        urls = {}
+        for nombre in ('proxy', 'env', 'agenda'):
+            handler_cls = cargar_handler(nombre)
+            handler_cls.log_message = lambda *args: None
+            servidor, urls[nombre] = iniciar_servidor(handler_cls)
+            self.servidores.append(servidor)
+        self.proxy_url, self.env_url, self.agenda_url = urls['proxy'], urls['env'], urls['agenda']
+        self.versiones_agenda = {}
+        self.altas_recientes = []
+        self.libres_usados = 0
+        self.cursores_historial = None
+
+    def _parar_handlers(self):
+        for servidor in self.servidores:
+            servidor.shutdown()
+            servidor.server_close()
+        self.servidores = []
+
+    def reiniciar(self):
+        """Dataset del upstream y estado del proxy como recién arrancados"""
+        self._parar_handlers()
+        self.upstream.reiniciar()
+        self._arrancar_handlers()
+
+    def __exit__(self, *exc):
+        self._parar_handlers()
+        self.servidor_upstream.shutdown()
+        self.servidor_upstream.server_close()
+
+
+# ============================================================
+# Mezclas de tráfico
+# ============================================================
+
+def _peticion_tablet(rng, entorno):
+    if rng.random() < 0.2:
+        return ('GET', f'{entorno.env_url}/api/env', None, {'X-Config-Token': CONFIG_TOKEN})
+    semana = rng.randrange(SEMANAS)
+    inicio = datetime.fromisoformat(FECHA_BASE).date() + timedelta(weeks=semana)
+    dias = dias_laborables(inicio, 7)
+    fin = dias[-1] + timedelta(days=1)
+    url = f'{entorno.proxy_url}/api/proxy/citas?startDate={inicio}&endDate={fin}&estado=Confirmada'
+    return ('GET', url, None, {})
+
+
+def _peticion_reservas(rng, entorno):
+    base = datetime.fromisoformat(FECHA_BASE).date().replace(day=1)
+    mes = rng.randrange(3)
+    inicio = (base + timedelta(days=32 * mes)).replace(day=1)
+    fin = ((inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1))
+    horarios = ','.join(f'{a}-{b}' for a, b in HORARIOS)
+    url = (f'{entorno.proxy_url}/api/proxy/disponibles?startDate={inicio}&endDate={fin}'
+           f'&duracion={DURACION_CITA}&horarios={horarios}&timezone=Europe/Madrid')
+    return ('GET', url, None, {})
+
+
+def _cuerpo_reserva(rng, inicio):
+    return {
+        'Nombre': rng.choice(NOMBRES),
+        'Telefono': f'+346{rng.randint(10000000, 99999999)}',
+        'Email': '',
+        'Servicio': rng.choice(SERVICIOS),
+        'startTime': iso(inicio),
+        'endTime': iso(inicio + timedelta(minutes=DURACION_CITA)),
+        'Matricula': '',
+        'Modelo': rng.choice(MODELOS),
+        'Notas': '',
+    }
+
+
+def _peticion_rafaga(rng, entorno):
+    # El widget solo ofrece slots libres y cada cliente reserva uno distinto: la ráfaga
+    # mide el camino de escritura, no los rechazos (de eso se ocupa "conflicto")
+    inicio = entorno.upstream.libres[entorno.libres_usados]
+    entorno.libres_usados += 1
+    cuerpo = _cuerpo_reserva(rng, inicio)
+    return ('POST', f'{entorno.proxy_url}/api/proxy/citas', json.dumps(cuerpo).encode(), {})
+
+
+def _peticion_conflicto(rng, entorno):
+    # Muchos clientes compiten por los mismos pocos slots desde una vista cacheada
+    inicio = rng.choice(entorno.upstream.libres[:5])
+    cuerpo = _cuerpo_reserva(rng, inicio)
+    return ('POST', f'{entorno.proxy_url}/api/proxy/citas', json.dumps(cuerpo).encode(), {})
+
+
+def _peticion_reintento(rng, entorno):
+    # Cliente con timeout agresivo: reenvía altas con la misma Idempotency-Key,
+    # a menudo mientras la original sigue en curso. Cada alta nueva va a un slot
+    # distinto, así que cualquier 409 es un reintento que no se reconoció
+    recientes = entorno.altas_recientes
+    libres = entorno.upstream.libres
+    if recientes and (rng.random() < 0.5 or len(recientes) >= len(libres)):
+        return rng.choice(recientes[-4:])
+    cuerpo = _cuerpo_reserva(rng, libres[len(recientes)])
+    peticion = ('POST', f'{entorno.proxy_url}/api/proxy/citas', json.dumps(cuerpo).encode(),
+                {'Idempotency-Key': f'bench-{rng.getrandbits(64):016x}'})
+    recientes.append(peticion)
+    return peticion
+
+
+def _peticion_agenda(rng, entorno):
+    semana = rng.randrange(SEMANAS)
+    desde = datetime.fromisoformat(FECHA_BASE).date() + timedelta(weeks=semana)
+    url = f'{entorno.agenda_url}/api/agenda?desde={desde}&dias=7'
+    # La tablet ya tiene la versión de casi todas las semanas que consulta
+    if rng.random() < 0.2:
+        return ('GET', url, None, {})
+    if desde not in entorno.versiones_agenda:
+        with urlopen(url, timeout=30) as resp:
+            entorno.versiones_agenda[desde] = resp.headers['ETag']
+    return ('GET', url, None, {'If-None-Match': entorno.versiones_agenda[desde]})
+
+
+def _peticion_ocupacion(rng, entorno):
+    metodo, url, body, headers = _peticion_tablet(rng, entorno)
+    if '/api/env' in url:
+        return metodo, url, body, headers
+    return metodo, f'{url}&fields=startTime,endTime,Estado', body, headers
+
+
+def _peticion_historial(rng, entorno):
+    # Páginas del historial: la primera o una siguiente con su cursor X-Next-Cursor real
+    url = (f'{entorno.proxy_url}/api/proxy/citas?estado=Cancelada&limit=20'
+           f'&fields=Id,Nombre,Servicio,startTime')
+    if entorno.cursores_historial is None:
+        entorno.cursores_historial = []
+        siguiente = url
+        while siguiente:
+            with urlopen(siguiente, timeout=30) as resp:
+                resp.read()
+                cursor = resp.headers.get('X-Next-Cursor')
+            siguiente = f'{url}&after={cursor}' if cursor else None
+            if cursor:
+                entorno.cursores_historial.append(cursor)
+    cursor = rng.choice([None, *entorno.cursores_historial])
+    return ('GET', f'{url}&after={cursor}' if cursor else url, None, {})
+
+
+MEZCLAS = {
+    'tablet': [(_peticion_tablet, 1.0)],
+    'reservas': [(_peticion_reservas, 1.0)],
+    'rafaga': [(_peticion_rafaga, 1.0)],
+    'conflicto': [(_peticion_conflicto, 1.0)],
+    'reintentos': [(_peticion_reintento, 1.0)],
+    'agenda': [(_peticion_agenda, 1.0)],
+    'ocupacion': [(_peticion_ocupacion, 1.0)],
+    'historial': [(_peticion_historial, 1.0)],
+    'mixto': [(_peticion_tablet, 0.65), (_peticion_reservas, 0.25), (_peticion_rafaga, 0.10)],
+}
+
+
+def generar_peticiones(nombre_mezcla, entorno, cantidad, semilla):
+    """Lista determinista de peticiones (method, url, body, headers) para una mezcla"""
+    rng = random.Random(f'{nombre_mezcla}-{semilla}')
+    generadores, pesos = zip(*MEZCLAS[nombre_mezcla])
+    return [rng.choices(generadores, pesos)[0](rng, entorno) for _ in range(cantidad)]
+
+
+def ejecutar_peticion(peticion, con_cuerpo=False):
+    """(latencia_ms, status, bytes) de una petición; con `con_cuerpo` añade la respuesta"""
+    method, url, body, headers = peticion
+    cabeceras = {'Content-Type': 'application/json', **headers}
+    inicio = time.perf_counter()
+    try:
+        with urlopen(Request(url, data=body, headers=cabeceras, method=method), timeout=30) as resp:
+            datos = resp.read()
+            status = resp.status
+    except HTTPError as e:
+        datos = e.read()
+        status = e.code
+    except Exception:
+        datos = b''
+        status = 0
+    latencia = (time.perf_counter() - inicio) * 1000
+    return (latencia, status, len(datos), datos) if con_cuerpo else (latencia, status, len(datos))
+
+
+def ejecutar_mezcla(nombre, entorno, concurrencia, cantidad, semilla, medir_memoria):
+    entorno.reiniciar()
+    peticiones = generar_peticiones(nombre, entorno, cantidad, semilla)
+
+    if medir_memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        resultados = list(pool.map(ejecutar_peticion, peticiones))
+    duracion = time.perf_counter() - inicio
+    pico_tracemalloc = None
+    if medir_memoria:
+        pico_tracemalloc = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        tracemalloc.stop()
+
+    # Esperar a que el proxy termine de notificar las escrituras confirmadas
+    if any(p[0] != 'GET' for p in peticiones):
+        # Entre dos lotes pasa como mínimo la latencia del webhook
+        pausa = 0.6 + entorno.upstream.webhook_ms / 1000
+        limite = time.perf_counter() + 5 + 4 * pausa
+        anterior = -1
+        while entorno.upstream.notificaciones != anterior and time.perf_counter() < limite:
+            anterior = entorno.upstream.notificaciones
+            time.sleep(pausa)
+
+    latencias = sorted(r[0] for r in resultados)
+    errores = sum(1 for r in resultados if not (200 <= r[1] < 300 or r[1] in (304, 409)))
+    total_bytes = sum(r[2] for r in resultados)
+    return {
+        'peticiones': cantidad,
+        'concurrencia': concurrencia,
+        'duracion_s': round(duracion, 3),
+        'throughput_rps': round(cantidad / duracion, 1) if duracion else 0,
+        'errores': errores,
+        'conflictos_409': sum(1 for r in resultados if r[1] == 409),
+        'no_modificadas_304': sum(1 for r in resultados if r[1] == 304),
+        'dobles_reservas': entorno.upstream.contar_solapes(),
+        'bytes_total': total_bytes,
+        'bytes_medio': round(total_bytes / cantidad) if cantidad else 0,
+        'latencia_ms': {
+            'media': round(sum(latencias) / len(latencias), 2) if latencias else 0,
+            'p50': round(percentil(latencias, 50), 2),
+            'p90': round(percentil(latencias, 90), 2),
+            'p95': round(percentil(latencias, 95), 2),
+            'p99': round(percentil(latencias, 99), 2),
+            'max': round(latencias[-1], 2) if latencias else 0,
+        },
+        'peticiones_upstream': entorno.upstream.peticiones,
+        'notificaciones_webhook': {
+            'envios': entorno.upstream.notificaciones,
+            'cambios': entorno.upstream.cambios_notificados,
+        },
+        'memoria': {
+            'tracemalloc_pico_mb': pico_tracemalloc,
+            'rss_max_mb': rss_maximo_mb(),
+        },
+    }
+
+
+# ============================================================
+# Informe
+# ============================================================
+
+def imprimir_resultados(resultados):
+    print(f"\n{'mezcla':<10} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5} {'409':>5} {'dobles':>6} "
+          f"{'bytes/req':>10} {'rss MB':>8}")
+    print('-' * 86)
+    for nombre, r in resultados.items():
+        lat = r['latencia_ms']
+        print(f"{nombre:<10} {r['throughput_rps']:>8} {lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8} "
+              f"{r['errores']:>5} {r['conflictos_409']:>5} {r['dobles_reservas']:>6} "
+              f"{r['bytes_medio']:>10} {str(r['memoria']['rss_max_mb']):>8}")
+
+
+def comparar(actual, ruta_base):
+    """Imprime la variación de throughput y p95 respecto a un JSON anterior"""
+    with open(ruta_base, encoding='utf-8') as f:
+        base = json.load(f)
+    print(f"\nComparación con {ruta_base} (commit {base['meta'].get('commit')})")
+    print(f"{'mezcla':<10} {'rps base':>10} {'rps':>10} {'Δ rps':>8} {'p95 base':>10} {'p95':>10} {'Δ p95':>8}")
+    print('-' * 72)
+    for nombre, r in actual['resultados'].items():
+        b = base['resultados'].get(nombre)
+        if not b:
+            continue
+        d_rps = _variacion(b['throughput_rps'], r['throughput_rps'])
+        d_p95 = _variacion(b['latencia_ms']['p95'], r['latencia_ms']['p95'])
+        print(f"{nombre:<10} {b['throughput_rps']:>10} {r['throughput_rps']:>10} {d_rps:>8} "
+              f"{b['latencia_ms']['p95']:>10} {r['latencia_ms']['p95']:>10} {d_p95:>8}")
+
+
+def _variacion(antes, despues):
+    if not antes:
+        return 'n/a'
+    return f'{(despues - antes) / antes * 100:+.1f}%'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark del proxy y del endpoint /api/env')
+    parser.add_argument('--mezcla', default='todas', choices=['todas', *MEZCLAS],
+                        help='Mezcla de tráfico a ejecutar')
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--peticiones', type=int, default=300, help='Peticiones por mezcla')
+    parser.add_argument('--latencia-ms', type=float, default=40, help='Latencia simulada del upstream')
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--webhook-ms', type=float, default=0, help='Latencia simulada del webhook')
+    parser.add_argument('--notificar', choices=['cola', 'cliente'], default='cola',
+                        help='cola: el proxy notifica en segundo plano; cliente: como en Vercel, '
+                             'solo marca la respuesta con X-Notificar-Cambio')
+    parser.add_argument('--num-citas', type=int, default=300, help='Tamaño del dataset upstream')
+    parser.add_argument('--relleno', type=int, default=0, help='Bytes extra en Notas de cada cita')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--memoria', action='store_true',
+                        help='Medir pico de memoria con tracemalloc (reduce el throughput)')
+    parser.add_argument('--salida', help='Ruta del JSON de resultados')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior para comparar')
+    args = parser.parse_args(argv)
+
+    mezclas = list(MEZCLAS) if args.mezcla == 'todas' else [args.mezcla]
+    # Un slot libre por petición: las altas de "rafaga" y "reintentos" nunca chocan entre sí
+    upstream = UpstreamSimulado(args.latencia_ms, args.jitter_ms, args.num_citas, args.relleno, args.semilla,
+                                libres_minimos=args.peticiones, webhook_ms=args.webhook_ms)
+    os.environ['PROXY_NOTIFICAR_CLIENTE'] = '1' if args.notificar == 'cliente' else '0'
+
+    resultados = {}
+    with EntornoLocal(upstream) as entorno:
+        for nombre in mezclas:
+            print(f'Ejecutando mezcla "{nombre}" ({args.peticiones} peticiones, concurrencia {args.concurrencia})...')
+            resultados[nombre] = ejecutar_mezcla(
+                nombre, entorno, args.concurrencia, args.peticiones, args.semilla, args.memoria
+            )
+
+    informe = {
+        'meta': {
+            'fecha': datetime.now(timezone.utc).isoformat(),
+            'commit': commit_actual(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'parametros': vars(args),
+        },
+        'resultados': resultados,
+    }
+
+    imprimir_resultados(resultados)
+    if args.comparar:
+        comparar(informe, args.comparar)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f'\nResultados guardados en {args.salida}')
+    return informe
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Diagnóstico rápido de la API de citas (sustituye a test_conexion.py, debug_api.py
+y ver_citas_hoy.py)
+
+Lanza todas las sondas en paralelo sobre una misma sesión HTTP y descarga el
+listado completo de /citas una sola vez: las comprobaciones de estructura,
+estados, solapes y citas de hoy se hacen sobre ese mismo dataset. Las respuestas
+GET se guardan en una cache local durante --ttl segundos.
+
+No pregunta nada, así que se puede lanzar desde cron; sale con código 1 si
+alguna comprobación falla.
+
+    python test/diagnostico.py
+    python test/diagnostico.py --json --proxy https://tablet.arvera.es
+    python test/diagnostico.py --hoy                  # lista las citas de hoy
+    python test/diagnostico.py --webhook-antiguo      # antes de migrar desde Cal.com
+    python test/diagnostico.py --escritura            # crea y cancela una cita de prueba
+    python test/diagnostico.py --escritura --proxy https://tablet.arvera.es   # ... a través del proxy
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configuración (mismas variables que los endpoints de api/)
+API_BASE_URL = os.getenv('API_BASE_URL', 'https://api-citas-seven.vercel.app/api')
+WEBHOOK_ANTIGUO = 'https://webhook.arvera.es/webhook/citas'
+TIMEZONE = os.getenv('TIMEZONE', 'Europe/Madrid')
+DURACION_CITA = int(os.getenv('DURACION_CITA', '45'))
+HORARIOS = os.getenv('HORARIOS', '08:30-12:15,15:45-18:00')
+CAMPOS_OBLIGATORIOS = ('Id', 'Nombre', 'Telefono', 'Servicio', 'startTime', 'endTime', 'Estado')
+CACHE_POR_DEFECTO = Path.home() / '.cache' / 'arvera' / 'diagnostico.json'
+
+
+# Colores para terminal (solo si la salida es una terminal)
+class Colors:
+    OKGREEN = '\033[92m'
+    WARNING = '\033[93m'
+    FAIL = '\033[91m'
+    ENDC = '\033[0m'
+    BOLD = '\033[1m'
+
+
+if not sys.stdout.isatty():
+    for _color in ('OKGREEN', 'WARNING', 'FAIL', 'ENDC', 'BOLD'):
+        setattr(Colors, _color, '')
+
+
+def parse_fecha(valor):
+    return datetime.fromisoformat(valor.replace('Z', '+00:00'))
+
+
+# ============================================================
+# Cache local con TTL
+# ============================================================
+
+class CacheLocal:
+    """Respuestas GET recientes guardadas en disco, válidas durante `ttl` segundos"""
+
+    def __init__(self, ruta, ttl):
+        self.ruta = Path(ruta) if ruta and ttl > 0 else None
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entradas = {}
+        if self.ruta and self.ruta.exists():
+            try:
+                self.entradas = json.loads(self.ruta.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                self.entradas = {}
+
+    def obtener(self, url):
+        if not self.ruta:
+            return None
+        with self.lock:
+            entrada = self.entradas.get(url)
+        if entrada and time.time() - entrada['t'] < self.ttl:
+            return entrada
+        return None
+
+    def guardar(self, url, status, datos):
+        if self.ruta:
+            with self.lock:
+                self.entradas[url] = {'t': time.time(), 'status': status, 'datos': datos}
+
+    def volcar(self):
+        if not self.ruta:
+            return
+        ahora = time.time()
+        with self.lock:
+            vigentes = {url: e for url, e in self.entradas.items() if ahora - e['t'] < self.ttl}
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Contiene datos de clientes: solo legible por el usuario
+        fd = os.open(self.ruta, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(vigentes, f, ensure_ascii=False)
+
+
+# ============================================================
+# Sondas
+# ============================================================
+
+class Diagnostico:
+    def __init__(self, api_url, api_key, cache, timeout):
+        self.api_url = api_url.rstrip('/')
+        self.api_key = api_key
+        self.cache = cache
+        self.timeout = timeout
+        # Una sola sesión: las sondas reutilizan las conexiones TLS abiertas
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+        self.tz = ZoneInfo(TIMEZONE)
+
+    def _cabeceras(self, url, extra=None):
+        cabeceras = {'Content-Type': 'application/json', **(extra or {})}
+        # El API_KEY solo se envía a la API, nunca al webhook ni al proxy
+        if self.api_key and url.startswith(self.api_url):
+            cabeceras['X-API-Key'] = self.api_key
+        return cabeceras
+
+    def get(self, url):
+        """GET JSON con cache; devuelve (status, datos, ms, desde_cache)"""
+        cacheada = self.cache.obtener(url)
+        if cacheada:
+            return cacheada['status'], cacheada['datos'], 0.0, True
+        inicio = time.perf_counter()
+        response = self.session.get(url, headers=self._cabeceras(url), timeout=self.timeout)
+        ms = (time.perf_counter() - inicio) * 1000
+        try:
+            datos = response.json()
+        except ValueError:
+            datos = response.text[:200]
+        if response.ok:
+            self.cache.guardar(url, response.status_code, datos)
+        return response.status_code, datos, ms, False
+
+    def escribir(self, method, url, cuerpo=None, idempotente=False):
+        """Escritura sin cache; con `idempotente` (solo el proxy la atiende) envía Idempotency-Key"""
+        cabeceras = self._cabeceras(url, {'Idempotency-Key': str(uuid.uuid4())} if idempotente else None)
+        inicio = time.perf_counter()
+        response = self.session.request(method, url, json=cuerpo, headers=cabeceras, timeout=self.timeout)
+        return response, (time.perf_counter() - inicio) * 1000
+
+    def rango_hoy(self):
+        """Inicio y fin del día local, en UTC"""
+        inicio = datetime.now(self.tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        fin = inicio + timedelta(days=1) - timedelta(microseconds=1)
+        return inicio.astimezone(timezone.utc), fin.astimezone(timezone.utc)
+
+
+def ejecutar_sonda(nombre, funcion, *args):
+    """Ejecuta una sonda y normaliza su resultado; una excepción es un fallo"""
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion(*args)
+    except Exception as e:
+        resultado = {'ok': False, 'error': str(e)}
+    resultado.setdefault('ms', round((time.perf_counter() - inicio) * 1000, 1))
+    return {'nombre': nombre, **resultado}
+
+
+def resultado_get(status, datos, ms, cache, **detalle):
+    resultado = {'ok': status == 200, 'status': status, 'ms': round(ms, 1), 'cache': cache, **detalle}
+    if status != 200:
+        resultado['error'] = datos if isinstance(datos, str) else json.dumps(datos, ensure_ascii=False)[:200]
+    return resultado
+
+
+def sonda_listado(diag):
+    """GET /citas sin filtros: el dataset que comparten las comprobaciones locales"""
+    status, datos, ms, cache = diag.get(f'{diag.api_url}/citas')
+    if status == 200 and not isinstance(datos, list):
+        return {'ok': False, 'status': status, 'ms': round(ms, 1), 'error': 'La respuesta no es una lista'}
+    if status != 200:
+        return resultado_get(status, datos, ms, cache)
+    resultado = resultado_get(status, datos, ms, cache, citas=len(datos))
+    resultado['datos'] = datos
+    return resultado
+
+
+def sonda_filtro_hoy(diag, dataset):
+    """GET /citas filtrado por hoy: el filtro del servidor debe coincidir con el local"""
+    inicio, fin = diag.rango_hoy()
+    status, datos, ms, cache = diag.get(
+        f"{diag.api_url}/citas?{urlencode({'startDate': inicio.isoformat(), 'endDate': fin.isoformat()})}"
+    )
+    if status != 200:
+        return resultado_get(status, datos, ms, cache)
+    locales = {c.get('Id') for c in citas_de_hoy(diag, dataset.result())}
+    remotas = {c.get('Id') for c in datos}
+    return resultado_get(status, datos, ms, cache, citas=len(remotas), coincide_con_listado=locales == remotas)
+
+
+def sonda_disponibles(diag):
+    """GET /disponibles de la próxima semana"""
+    hoy = datetime.now(diag.tz).date()
+    params = {
+        'startDate': hoy.isoformat(),
+        'endDate': (hoy + timedelta(days=7)).isoformat(),
+        'duracion': DURACION_CITA,
+        'horarios': HORARIOS,
+        'timezone': TIMEZONE
+    }
+    status, datos, ms, cache = diag.get(f'{diag.api_url}/disponibles?{urlencode(params)}')
+    slots = len(datos.get('disponibles', [])) if status == 200 and isinstance(datos, dict) else None
+    return resultado_get(status, datos, ms, cache, slots_libres=slots)
+
+
+def sonda_url(diag, url):
+    """GET de un endpoint que solo tiene que responder 200"""
+    status, datos, ms, cache = diag.get(url)
+    total = len(datos) if status == 200 and isinstance(datos, list) else None
+    return resultado_get(status, datos, ms, cache, elementos=total)
+
+
+def sonda_escritura(diag, proxy_url=None):
+    """
+    Crea una cita de prueba en una fecha lejana y la cancela. Con --proxy la escritura
+    pasa por /api/proxy, que es quien atiende la Idempotency-Key.
+    """
+    base = f'{proxy_url}/api/proxy' if proxy_url else diag.api_url
+    inicio = datetime(2099, 12, 31, 8, 30, tzinfo=timezone.utc)
+    cita = {
+        'Nombre': 'Diagnóstico',
+        'Telefono': '600000000',
+        'Email': '',
+        'Servicio': 'Prueba',
+        'startTime': inicio.isoformat().replace('+00:00', 'Z'),
+        'endTime': (inicio + timedelta(minutes=DURACION_CITA)).isoformat().replace('+00:00', 'Z'),
+        'Matricula': '',
+        'Modelo': '',
+        'Notas': 'Cita de prueba de test/diagnostico.py'
+    }
+    alta, ms_alta = diag.escribir('POST', f'{base}/citas', cita, idempotente=bool(proxy_url))
+    if alta.status_code != 201:
+        return {'ok': False, 'status': alta.status_code, 'ms': round(ms_alta, 1), 'error': alta.text[:200]}
+    creada = alta.json()
+    cita_id = (creada.get('cita') if isinstance(creada.get('cita'), dict) else creada).get('Id')
+    baja, ms_baja = diag.escribir('DELETE', f'{base}/citas/{cita_id}', idempotente=bool(proxy_url))
+    resultado = {
+        'ok': baja.ok,
+        'status': baja.status_code,
+        'ms': round(ms_alta + ms_baja, 1),
+        'via': 'proxy' if proxy_url else 'api',
+        'alta_ms': round(ms_alta, 1),
+        'baja_ms': round(ms_baja, 1),
+    }
+    if not baja.ok:
+        resultado['error'] = f'No se pudo cancelar la cita de prueba {cita_id}: {baja.text[:200]}'
+    return resultado
+
+
+# ============================================================
+# Comprobaciones sobre el dataset (sin peticiones)
+# ============================================================
+
+def citas_de_hoy(diag, citas):
+    inicio, fin = diag.rango_hoy()
+    hoy = []
+    for cita in citas:
+        try:
+            if inicio <= parse_fecha(cita['startTime']) <= fin:
+                hoy.append(cita)
+        except (KeyError, AttributeError, ValueError):
+            continue
+    return sorted(hoy, key=lambda c: c['startTime'])
+
+
+def comprobar_estructura(citas):
+    incompletas = [c.get('Id') for c in citas if any(not c.get(campo) for campo in CAMPOS_OBLIGATORIOS)]
+    campos = {clave: type(valor).__name__ for clave, valor in citas[0].items()} if citas else {}
+    return {'ok': not incompletas, 'campos': campos, 'incompletas': len(incompletas), 'ids_incompletas': incompletas[:10]}
+
+
+def comprobar_estados(citas):
+    return {'ok': True, 'por_estado': dict(Counter(c.get('Estado') or 'N/A' for c in citas))}
+
+
+def comprobar_solapes(citas):
+    """Citas confirmadas que empiezan antes de que termine otra (dobles reservas)"""
+    intervalos = []
+    for cita in citas:
+        if cita.get('Estado') != 'Confirmada':
+            continue
+        try:
+            intervalos.append((parse_fecha(cita['startTime']), parse_fecha(cita['endTime']), cita.get('Id')))
+        except (KeyError, AttributeError, ValueError):
+            continue
+    intervalos.sort()
+    solapes = []
+    fin_max, id_max = None, None
+    for inicio, fin, cita_id in intervalos:
+        if fin_max is not None and inicio < fin_max:
+            solapes.append([id_max, cita_id])
+        if fin_max is None or fin > fin_max:
+            fin_max, id_max = fin, cita_id
+    return {'ok': not solapes, 'solapes': len(solapes), 'ejemplos': solapes[:10]}
+
+
+def comprobar_hoy(diag, citas):
+    hoy = citas_de_hoy(diag, citas)
+    # Sin datos personales: el informe puede acabar en logs de cron
+    resumen = [{
+        'hora': parse_fecha(c['startTime']).astimezone(diag.tz).strftime('%H:%M'),
+        'servicio': c.get('Servicio'),
+        'estado': c.get('Estado'),
+    } for c in hoy]
+    return {'ok': True, 'citas': len(hoy), 'agenda': resumen}
+
+
+# ============================================================
+# Ejecución
+# ============================================================
+
+def diagnosticar(diag, proxy_url=None, webhook_antiguo=False, escritura=False):
+    """Lanza las sondas en paralelo; devuelve (resultados, dataset)"""
+    dataset = Future()
+
+    def listado():
+        resultado = ejecutar_sonda('api_citas', sonda_listado, diag)
+        dataset.set_result(resultado.pop('datos', []))
+        return resultado
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futuro_listado = pool.submit(listado)
+        futuros = [
+            ('api_citas_hoy', pool.submit(ejecutar_sonda, 'api_citas_hoy', sonda_filtro_hoy, diag, dataset)),
+            ('api_disponibles', pool.submit(ejecutar_sonda, 'api_disponibles', sonda_disponibles, diag)),
+        ]
+        if webhook_antiguo:
+            futuros.append(('webhook_antiguo', pool.submit(
+                ejecutar_sonda, 'webhook_antiguo', sonda_url, diag, WEBHOOK_ANTIGUO)))
+        if proxy_url:
+            hoy = datetime.now(diag.tz).date()
+            futuros.append(('proxy_citas', pool.submit(
+                ejecutar_sonda, 'proxy_citas', sonda_url, diag,
+                f'{proxy_url}/api/proxy/citas?startDate={hoy}&endDate={hoy + timedelta(days=1)}'
+                f'&estado=Confirmada&fields=Id,startTime')))
+            futuros.append(('proxy_agenda', pool.submit(
+                ejecutar_sonda, 'proxy_agenda', sonda_url, diag, f'{proxy_url}/api/agenda?desde={hoy}&dias=7')))
+        if escritura:
+            futuros.append(('escritura', pool.submit(ejecutar_sonda, 'escritura', sonda_escritura, diag, proxy_url)))
+
+        # El listado completo alimenta las comprobaciones locales
+        resultados = [futuro_listado.result()]
+        citas = dataset.result()
+        if resultados[0]['ok']:
+            resultados += [
+                ejecutar_sonda('estructura', comprobar_estructura, citas),
+                ejecutar_sonda('estados', comprobar_estados, citas),
+                ejecutar_sonda('solapes', comprobar_solapes, citas),
+                ejecutar_sonda('citas_hoy', comprobar_hoy, diag, citas),
+            ]
+        resultados += [futuro.result() for _, futuro in futuros]
+    return resultados, citas
+
+
+def imprimir_resultados(resultados, duracion):
+    print(f"\n{Colors.BOLD}{'sonda':<18} {'status':>6} {'ms':>8}  detalle{Colors.ENDC}")
+    print('-' * 72)
+    omitir = {'nombre', 'ok', 'status', 'ms', 'cache', 'error', 'agenda', 'campos', 'ids_incompletas', 'ejemplos'}
+    for r in resultados:
+        marca = f"{Colors.OKGREEN}✓{Colors.ENDC}" if r['ok'] else f"{Colors.FAIL}✗{Colors.ENDC}"
+        ms = 'cache' if r.get('cache') else f"{r['ms']:.0f}"
+        detalle = ', '.join(f'{k}={v}' for k, v in r.items() if k not in omitir)
+        if r.get('error'):
+            detalle = f"{Colors.FAIL}{r['error']}{Colors.ENDC}"
+        print(f"{marca} {r['nombre']:<16} {str(r.get('status', '')):>6} {ms:>8}  {detalle}")
+    correctas = sum(1 for r in resultados if r['ok'])
+    color = Colors.OKGREEN if correctas == len(resultados) else Colors.FAIL
+    print(f"\n{color}{correctas}/{len(resultados)} comprobaciones correctas en {duracion:.2f} s{Colors.ENDC}")
+
+
+def imprimir_hoy(diag, citas):
+    hoy = citas_de_hoy(diag, citas)
+    print(f"\n{Colors.BOLD}Citas de hoy ({len(hoy)}){Colors.ENDC}")
+    for i, cita in enumerate(hoy, 1):
+        hora = parse_fecha(cita['startTime']).astimezone(diag.tz).strftime('%H:%M')
+        print(f"{i}. {hora} - {cita.get('Nombre', 'N/A')}  [{cita.get('Estado', 'N/A')}]")
+        print(f"   📞 {cita.get('Telefono', 'N/A')}   🔧 {cita.get('Servicio', 'N/A')}")
+        if cita.get('Modelo'):
+            print(f"   🚗 {cita.get('Modelo')} ({cita.get('Matricula', '')})")
+        if cita.get('Notas'):
+            print(f"   📝 {cita.get('Notas')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Diagnóstico de la API de citas')
+    parser.add_argument('--api', default=API_BASE_URL, help='URL base de la API')
+    parser.add_argument('--proxy', help='URL del despliegue en Vercel para probar también /api/proxy y /api/agenda')
+    parser.add_argument('--webhook-antiguo', action='store_true', help='Probar también el webhook de Cal.com')
+    parser.add_argument('--escritura', action='store_true',
+                        help='Crear y cancelar una cita de prueba (a través de --proxy si se indica)')
+    parser.add_argument('--hoy', action='store_true', help='Listar las citas de hoy (salida de texto)')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    parser.add_argument('--ttl', type=float, default=60, help='Segundos que vale la cache local (0 = sin cache)')
+    parser.add_argument('--cache', default=str(CACHE_POR_DEFECTO), help='Ruta de la cache local')
+    parser.add_argument('--timeout', type=float, default=10, help='Timeout por petición (segundos)')
+    args = parser.parse_args(argv)
+
+    cache = CacheLocal(args.cache, args.ttl)
+    diag = Diagnostico(args.api, os.getenv('API_KEY', ''), cache, args.timeout)
+
+    inicio = time.perf_counter()
+    resultados, citas = diagnosticar(
+        diag, args.proxy.rstrip('/') if args.proxy else None, args.webhook_antiguo, args.escritura
+    )
+    duracion = time.perf_counter() - inicio
+    try:
+        cache.volcar()
+    except OSError as e:
+        print(f'{Colors.WARNING}No se pudo guardar la cache: {e}{Colors.ENDC}', file=sys.stderr)
+
+    ok = all(r['ok'] for r in resultados)
+    if args.json:
+        print(json.dumps({
+            'fecha': datetime.now(timezone.utc).isoformat(),
+            'api': diag.api_url,
+            'ok': ok,
+            'duracion_ms': round(duracion * 1000, 1),
+            'sondas': resultados,
+        }, indent=2, ensure_ascii=False))
+    else:
+        print(f"{Colors.BOLD}DIAGNÓSTICO - {diag.api_url}{Colors.ENDC}")
+        imprimir_resultados(resultados, duracion)
+        if args.hoy:
+            imprimir_hoy(diag, citas)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
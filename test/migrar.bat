@@ -24,7 +24,7 @@ if "%opcion%"=="5" goto end
 :test
 echo.
 echo Ejecutando prueba de conectividad...
-python test_conexion.py
+python diagnostico.py --webhook-antiguo
 pause
 goto end
 
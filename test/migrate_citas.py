@@ -9,12 +9,18 @@ import requests
 import json
 from datetime import datetime
 import time
+import uuid
 import pytz
 
 # Configuración
 WEBHOOK_ANTIGUO = 'https://webhook.arvera.es/webhook/citas'
 API_NUEVA = 'https://api-citas-seven.vercel.app/api/citas'
 TIMEZONE_MADRID = pytz.timezone('Europe/Madrid')
+REINTENTOS = 3  # Reintentos por cita (misma Idempotency-Key)
+# Solo el proxy (/api/proxy/citas) atiende la Idempotency-Key. Contra la API directa solo
+# se reintenta si no se llegó a conectar: tras un timeout de lectura o un 5xx la cita
+# pudo crearse y reintentar la duplicaría
+REINTENTOS_SEGUROS = '/api/proxy/' in API_NUEVA
 
 # Colores para terminal
 class Colors:
@@ -132,13 +138,28 @@ def migrar_cita(cita_antigua, index, total):
             print_warning(f"[{index+1}/{total}] Cita sin fechas válidas (ID: {cita_antigua.get('id', 'N/A')})")
             return False
         
-        # Enviar a la nueva API
-        response = requests.post(
-            API_NUEVA,
-            json=cita_nueva,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
+        # Enviar a la nueva API. La Idempotency-Key depende solo de la cita antigua,
+        # así a través del proxy un reintento (o volver a lanzar la migración) no la duplica
+        clave = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{WEBHOOK_ANTIGUO}#{cita_antigua.get('id')}#{cita_nueva['startTime']}"))
+        for intento in range(REINTENTOS + 1):
+            try:
+                response = requests.post(
+                    API_NUEVA,
+                    json=cita_nueva,
+                    headers={'Content-Type': 'application/json', 'Idempotency-Key': clave},
+                    timeout=10
+                )
+                if response.status_code < 500 or intento == REINTENTOS or not REINTENTOS_SEGUROS:
+                    break
+            except requests.exceptions.ConnectTimeout:
+                # La petición no llegó a enviarse: siempre es seguro reintentar
+                if intento == REINTENTOS:
+                    raise
+            except requests.exceptions.RequestException:
+                if intento == REINTENTOS or not REINTENTOS_SEGUROS:
+                    raise
+            print_warning(f"[{index+1}/{total}] Reintentando ({intento + 1}/{REINTENTOS})...")
+            time.sleep(2 ** intento)
         
         if response.status_code == 201:
             # Mostrar fecha y hora
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Reproduce tráfico capturado por el proxy (PROXY_CAPTURA) contra una instancia local
+
+Lee el log de captura y sus rotaciones (captura.log.3 ... captura.log.1, captura.log),
+y vuelve a emitir cada petición respetando los intervalos originales a 1× o N× de
+velocidad. Sirve para juzgar cambios de cache o pooling con la forma real de las
+consultas de las tablets y del widget de reservas.
+
+Por defecto levanta el mismo entorno local que test/benchmark_proxy.py (upstream
+simulado + api/proxy.py); con --url se apunta a un proxy ya en marcha. Un proxy
+real (también `vercel dev`) escribe en la API de producción, así que con --url
+solo se reproducen las lecturas salvo que se pase --escrituras.
+
+    python test/replay_trafico.py /tmp/captura.log --velocidad 10 --salida replay.json
+    python test/replay_trafico.py /tmp/captura.log --url http://localhost:3000 --velocidad 1
+
+También acepta los logs de la función exportados de Vercel (PROXY_CAPTURA=stdout):
+de cada línea se toma el objeto JSON, ignorando el prefijo y las líneas ajenas.
+
+Los datos personales no se capturan, así que los cuerpos de POST/PUT se sintetizan
+con el mismo tamaño que el original. En las lecturas los {id} se sustituyen por citas
+existentes; los PUT/DELETE solo tocan citas que la propia reproducción ha creado (y
+el PUT las deja en su mismo slot), y se omiten mientras no haya ninguna.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from benchmark_proxy import (  # noqa: E402
+    DURACION_CITA, FECHA_BASE, MODELOS, SEMANAS, SERVICIOS,
+    EntornoLocal, UpstreamSimulado, commit_actual, dias_laborables,
+    ejecutar_peticion, iso, percentil, slots_del_dia,
+)
+
+
+def archivos_captura(ruta):
+    """Log principal más sus rotaciones, del más antiguo al más reciente"""
+    base = Path(ruta)
+    rotados = sorted(
+        (p for p in base.parent.glob(base.name + '.*') if p.suffix[1:].isdigit()),
+        key=lambda p: int(p.suffix[1:]),
+        reverse=True
+    )
+    return [*rotados, base] if base.exists() else rotados
+
+
+def leer_captura(ruta):
+    registros = []
+    for archivo in archivos_captura(ruta):
+        with open(archivo, encoding='utf-8') as f:
+            for linea in f:
+                inicio = linea.find('{')
+                if inicio < 0:
+                    continue
+                try:
+                    registro = json.loads(linea[inicio:].strip())
+                except ValueError:
+                    continue
+                if isinstance(registro, dict) and {'t', 'm', 'p'} <= registro.keys():
+                    registros.append(registro)
+    registros.sort(key=lambda r: r['t'])
+    return registros
+
+
+def obtener_ids(proxy_url):
+    """Ids de citas existentes para rellenar las lecturas de /citas/{id}"""
+    try:
+        with urlopen(f'{proxy_url}/api/proxy/citas?estado=Confirmada', timeout=30) as resp:
+            return [c['Id'] for c in json.loads(resp.read()) if c.get('Id')] or ['replay-id']
+    except Exception:
+        return ['replay-id']
+
+
+def cuerpo_sintetico(rng, tamano, libres=None):
+    """
+    Cita ficticia con el mismo tamaño aproximado que el cuerpo capturado. Con `libres`
+    (slots libres del upstream simulado) cada alta toma el siguiente slot libre, para
+    que la reproducción ejercite la escritura y no la detección de conflictos.
+    """
+    if libres:
+        inicio = libres.pop(0)
+    else:
+        dia = rng.choice(dias_laborables(datetime.fromisoformat(FECHA_BASE).date(), SEMANAS * 5))
+        inicio = rng.choice(slots_del_dia(dia))
+    cita = {
+        'Nombre': 'Replay',
+        'Telefono': '+34600000000',
+        'Email': '',
+        'Servicio': rng.choice(SERVICIOS),
+        'startTime': iso(inicio),
+        'endTime': iso(inicio + timedelta(minutes=DURACION_CITA)),
+        'Matricula': '',
+        'Modelo': rng.choice(MODELOS),
+        'Notas': '',
+    }
+    cuerpo = json.dumps(cita).encode()
+    if tamano > len(cuerpo):
+        cita['Notas'] = 'x' * (tamano - len(cuerpo))
+        cuerpo = json.dumps(cita).encode()
+    return cuerpo
+
+
+def construir_peticion(registro, proxy_url, ids, rng, libres=None):
+    # El {id} de las escrituras se resuelve al lanzarlas, con una cita creada por la reproducción
+    path = registro['p'] if registro['m'] != 'GET' else registro['p'].replace('{id}', rng.choice(ids))
+    query = urlencode(registro.get('q') or {})
+    url = f'{proxy_url}/api/proxy{path}' + (f'?{query}' if query else '')
+    body = None
+    if registro['m'] in ('POST', 'PUT') and registro.get('b'):
+        body = cuerpo_sintetico(rng, registro['b'], libres if registro['m'] == 'POST' else None)
+    return registro['m'], url, body, {}
+
+
+def cita_de_respuesta(datos):
+    """Cita devuelta por un alta (el proxy puede envolverla en {'cita': ...})"""
+    try:
+        cita = json.loads(datos)
+    except ValueError:
+        return None
+    if isinstance(cita, dict) and isinstance(cita.get('cita'), dict):
+        cita = cita['cita']
+    return cita if isinstance(cita, dict) and cita.get('Id') else None
+
+
+def con_cita(peticion, cita):
+    """Sustituye {id} por la cita creada y, en un PUT, mantiene su slot"""
+    method, url, body, headers = peticion
+    url = url.replace('{id}', cita['Id'])
+    if body is not None:
+        datos = json.loads(body)
+        datos['startTime'], datos['endTime'] = cita['startTime'], cita['endTime']
+        body = json.dumps(datos).encode()
+    return method, url, body, headers
+
+
+def reproducir(registros, proxy_url, velocidad, concurrencia, semilla, libres=None):
+    """Emite las peticiones respetando los intervalos originales / velocidad"""
+    rng = random.Random(semilla)
+    ids = obtener_ids(proxy_url)
+    libres = list(libres) if libres else None
+    peticiones = [construir_peticion(r, proxy_url, ids, rng, libres) for r in registros]
+
+    resultados = [None] * len(registros)
+    retrasos = []
+    creadas = []
+    lock = threading.Lock()
+
+    def lanzar(indice, objetivo):
+        with lock:
+            retrasos.append(max(0.0, time.perf_counter() - objetivo) * 1000)
+        peticion = peticiones[indice]
+        method, url = peticion[0], peticion[1]
+        if '{id}' in url:
+            # Nunca se modifica ni cancela una cita que no sea de la reproducción
+            with lock:
+                if not creadas:
+                    return
+                cita = creadas.pop() if method == 'DELETE' else rng.choice(creadas)
+            peticion = con_cita(peticion, cita)
+        if method == 'POST':
+            latencia, status, tamano, datos = ejecutar_peticion(peticion, con_cuerpo=True)
+            cita = cita_de_respuesta(datos) if 200 <= status < 300 else None
+            if cita:
+                with lock:
+                    creadas.append(cita)
+            resultados[indice] = (latencia, status, tamano)
+        else:
+            resultados[indice] = ejecutar_peticion(peticion)
+
+    t0 = registros[0]['t']
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        for indice, registro in enumerate(registros):
+            objetivo = inicio + ((registro['t'] - t0) / 1000 / velocidad if velocidad else 0)
+            espera = objetivo - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            pool.submit(lanzar, indice, objetivo)
+    duracion = time.perf_counter() - inicio
+    return resultados, duracion, sorted(retrasos)
+
+
+def resumir(registros, resultados, duracion, retrasos):
+    # Sin resultado: PUT/DELETE omitido porque aún no había citas de la reproducción
+    lanzadas = [(g, r) for g, r in zip(registros, resultados) if r is not None]
+    omitidas = len(resultados) - len(lanzadas)
+    resultados = [r for _, r in lanzadas]
+    por_ruta = defaultdict(list)
+    for registro, (latencia, status, _) in lanzadas:
+        por_ruta[f"{registro['m']} {registro['p']}"].append((latencia, status, registro.get('u')))
+
+    rutas = {}
+    for clave, filas in sorted(por_ruta.items()):
+        latencias = sorted(f[0] for f in filas)
+        originales = sorted(f[2] for f in filas if f[2] is not None)
+        rutas[clave] = {
+            'peticiones': len(filas),
+            'errores': sum(1 for f in filas if not (200 <= f[1] < 300 or f[1] == 409)),
+            'conflictos_409': sum(1 for f in filas if f[1] == 409),
+            'p50_ms': round(percentil(latencias, 50), 2),
+            'p95_ms': round(percentil(latencias, 95), 2),
+            'upstream_original_p50_ms': round(percentil(originales, 50), 2) if originales else None,
+        }
+
+    latencias = sorted(r[0] for r in resultados)
+    return {
+        'peticiones': len(resultados),
+        'omitidas': omitidas,
+        'duracion_s': round(duracion, 3),
+        'throughput_rps': round(len(resultados) / duracion, 1) if duracion else 0,
+        'errores': sum(1 for r in resultados if not (200 <= r[1] < 300 or r[1] == 409)),
+        'conflictos_409': sum(1 for r in resultados if r[1] == 409),
+        'latencia_ms': {
+            'p50': round(percentil(latencias, 50), 2),
+            'p95': round(percentil(latencias, 95), 2),
+            'p99': round(percentil(latencias, 99), 2),
+            'max': round(latencias[-1], 2) if latencias else 0,
+        },
+        'retraso_planificacion_p95_ms': round(percentil(retrasos, 95), 2),
+        'rutas': rutas,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reproduce tráfico capturado por el proxy')
+    parser.add_argument('captura', help='Ruta del log de captura (PROXY_CAPTURA)')
+    parser.add_argument('--velocidad', type=float, default=1.0,
+                        help='1 = tiempo real, N = N veces más rápido, 0 = sin esperas')
+    parser.add_argument('--url', help='Proxy ya en marcha (por defecto se levanta uno local)')
+    parser.add_argument('--escrituras', action='store_true',
+                        help='Con --url, reproducir también las escrituras: crea citas reales de prueba '
+                             '("Replay") y solo modifica o cancela esas')
+    parser.add_argument('--concurrencia', type=int, default=32, help='Máximo de peticiones simultáneas')
+    parser.add_argument('--latencia-ms', type=float, default=40, help='Latencia del upstream simulado')
+    parser.add_argument('--num-citas', type=int, default=300)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', help='Ruta del JSON de resultados')
+    args = parser.parse_args(argv)
+
+    registros = leer_captura(args.captura)
+    if not registros:
+        print(f'No hay registros en {args.captura}')
+        return None
+    print(f'{len(registros)} peticiones capturadas, reproduciendo a {args.velocidad or "máxima"}× ...')
+
+    if args.url and not args.escrituras:
+        omitidas = sum(1 for r in registros if r['m'] != 'GET')
+        registros = [r for r in registros if r['m'] == 'GET']
+        if omitidas:
+            print(f'Se omiten {omitidas} escrituras (usa --escrituras para reproducirlas contra --url)')
+        if not registros:
+            return None
+
+    if args.url:
+        resultados, duracion, retrasos = reproducir(
+            registros, args.url.rstrip('/'), args.velocidad, args.concurrencia, args.semilla
+        )
+    else:
+        altas = sum(1 for r in registros if r['m'] == 'POST')
+        upstream = UpstreamSimulado(args.latencia_ms, num_citas=args.num_citas, semilla=args.semilla,
+                                    libres_minimos=altas)
+        with EntornoLocal(upstream) as entorno:
+            resultados, duracion, retrasos = reproducir(
+                registros, entorno.proxy_url, args.velocidad, args.concurrencia, args.semilla, upstream.libres
+            )
+
+    resumen = resumir(registros, resultados, duracion, retrasos)
+    print(f"\n{'ruta':<28} {'n':>6} {'err':>5} {'409':>5} {'p50':>8} {'p95':>8} {'orig p50':>9}")
+    print('-' * 74)
+    for ruta, r in resumen['rutas'].items():
+        print(f"{ruta:<28} {r['peticiones']:>6} {r['errores']:>5} {r['conflictos_409']:>5} {r['p50_ms']:>8} "
+              f"{r['p95_ms']:>8} {str(r['upstream_original_p50_ms']):>9}")
+    print(f"\nTotal: {resumen['throughput_rps']} rps, p95 {resumen['latencia_ms']['p95']} ms, "
+          f"{resumen['errores']} errores, {resumen['conflictos_409']} conflictos 409, "
+          f"{resumen['omitidas']} omitidas")
+
+    if args.salida:
+        informe = {
+            'meta': {
+                'fecha': datetime.now(timezone.utc).isoformat(),
+                'commit': commit_actual(),
+                'parametros': vars(args),
+            },
+            'resultados': {'replay': resumen},
+        }
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f'Resultados guardados en {args.salida}')
+    return resumen
+
+
+if __name__ == '__main__':
+    main()